@@ -0,0 +1,225 @@
+"""Vectorized evaluation of the positions one ply above the search horizon.
+
+The `*_score_wrap` heuristics in `game_agent` are called once per leaf, so
+at the widest level of the tree most of the time goes to interpreter
+overhead. A `BatchEvaluator` instead takes a node and all of its legal moves
+and computes the features of every child at once with NumPy: the mobility of
+both players from a precomputed knight-move adjacency matrix and the
+distance to the center from a per-cell array. The parameterized families
+are then evaluated on those features for any number of `(p1, p2)` pairs in
+one array expression.
+
+Scores are the same floats the scalar heuristics return, so a player using
+`batch_score_wrap(family, params)` as its `batch_score` searches exactly the
+same tree as one using the matching `*_score_wrap(params)`.
+
+Example
+-------
+    python batch_eval.py --positions 20 --depth 4
+"""
+import argparse
+import random
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from isolation import Board
+
+from bitboard import DIRECTIONS, board_masks, iter_bits, to_index
+from game_agent import (
+    AlphaBetaPlayer,
+    center_div_score_wrap, div_score_wrap, minus_score_wrap,
+)
+
+FAMILIES = ('div', 'minus', 'center_div')
+
+SCALAR_FACTORIES = {
+    'div': div_score_wrap,
+    'minus': minus_score_wrap,
+    'center_div': center_div_score_wrap,
+}
+
+
+class BatchEvaluator():
+    """Feature extraction and family scores for all children of a node.
+
+    Parameters
+    ----------
+    width, height : int
+        Board dimensions.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.size = size = width * height
+        self.adjacency = np.zeros((size, size))
+        for r in range(height):
+            for c in range(width):
+                for dr, dc in DIRECTIONS:
+                    if 0 <= r + dr < height and 0 <= c + dc < width:
+                        self.adjacency[r * width + c, (r + dr) * width + c + dc] = 1.
+        rows, cols = np.divmod(np.arange(size), width)
+        w, h = width / 2., height / 2.
+        self.center = (h - rows) ** 2 + (w - cols) ** 2
+
+    def features(self, game, moves, player):
+        """Features of the positions after each of the active player's `moves`,
+        from the point of view of `player`.
+
+        Returns
+        -------
+        dict
+            'own', 'opp': mobility of `player` and of its opponent;
+            'center': squared distance of `player` to the center (NaN while
+            it has not moved); 'blanks': number of blank cells (a scalar);
+            'result': +1/-1 where `player` has won/lost, else 0.
+        """
+        blanks, active, inactive = board_masks(game)
+        cells = np.fromiter((to_index(move, self.width) for move in moves), int, len(moves))
+        blank = np.zeros(self.size)
+        blank[list(iter_bits(blanks))] = 1.
+        n_blanks = int(blank.sum()) - 1
+
+        # The mover stands on its target cell, which is already blocked in
+        # the child, so its mobility is the parent's count from that cell
+        mover = self.adjacency[cells].dot(blank)
+        if inactive is None:
+            other = np.full(len(moves), float(n_blanks))
+        else:
+            other = self.adjacency[inactive].dot(blank) - self.adjacency[inactive, cells]
+
+        # The player to move in the child is the one who did not move: it
+        # loses if it is stuck
+        if player is game.active_player:
+            own, opp, result = mover, other, (other == 0).astype(float)
+            center = self.center[cells]
+        else:
+            own, opp, result = other, mover, -(other == 0).astype(float)
+            center = np.full(len(moves), np.nan if inactive is None else self.center[inactive])
+        return {'own': own, 'opp': opp, 'center': center, 'blanks': n_blanks,
+                'result': result}
+
+    def scores(self, features, family, params):
+        """Scores of the children under `family` for every `(p1, p2)` pair in
+        `params`, as an array of shape `(len(params), number of children)`.
+        """
+        params = np.asarray(params, dtype=float).reshape(-1, 2)
+        p1, p2 = params[:, :1], params[:, 1:]
+        own, opp = features['own'], features['opp']
+        if family == 'minus':
+            values = p1 * own - p2 * opp
+        elif family == 'div' or family == 'center_div':
+            values = (0.1 + p1 * own) / (0.1 + p2 * opp)
+            if family == 'center_div' and features['blanks'] > self.size / 2:
+                values = np.broadcast_to(-features['center'], values.shape).copy()
+        else:
+            raise ValueError("Unknown score family {!r}".format(family))
+        result = np.broadcast_to(features['result'], values.shape)
+        values[result > 0] = float('inf')
+        values[result < 0] = float('-inf')
+        return values
+
+    def score_families(self, game, moves, player, grid):
+        """Scores of the children for several families at once.
+
+        Parameters
+        ----------
+        grid : dict
+            Maps family names to lists of `(p1, p2)` pairs.
+
+        Returns
+        -------
+        dict
+            Family name -> array of shape `(len(grid[family]), len(moves))`.
+        """
+        features = self.features(game, moves, player)
+        return dict((family, self.scores(features, family, params))
+                    for family, params in grid.items())
+
+
+@lru_cache(maxsize=None)
+def evaluator(width, height):
+    return BatchEvaluator(width, height)
+
+
+def batch_score_wrap(family, params):
+    """Batched counterpart of the `*_score_wrap` heuristic `family` for one
+    `(p1, p2)` pair, usable as `AlphaBetaPlayer(batch_score=...)`.
+    """
+    if family not in FAMILIES:
+        raise ValueError("Unknown score family {!r}".format(family))
+    params = [tuple(params)]
+
+    def batch_score(game, moves, player):
+        batch = evaluator(game.width, game.height)
+        return batch.scores(batch.features(game, moves, player), family, params)[0].tolist()
+    return batch_score
+
+
+def random_positions(player_1, player_2, num_positions, plies, seed=0):
+    """Boards between the two players reached by `plies` random moves,
+    skipping finished games.
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < num_positions:
+        game = Board(player_1, player_2)
+        for _ in range(plies):
+            moves = game.get_legal_moves()
+            if not moves:
+                break
+            game.apply_move(rng.choice(sorted(moves)))
+        if game.get_legal_moves():
+            positions.append(game)
+    return positions
+
+
+def benchmark(num_positions=20, depth=4, plies=8, family='div', params=(1., 1.), seed=0):
+    """Fixed-depth alpha-beta over random positions with scalar and batched
+    leaf evaluation. `plies` is rounded down to an even number so that the
+    searching player is the one to move.
+
+    Returns
+    -------
+    dict
+        Seconds spent by each mode and whether both chose the same moves.
+    """
+    results = {}
+    moves = {}
+    for mode in ('scalar', 'batch'):
+        player = AlphaBetaPlayer(score_fn=SCALAR_FACTORIES[family](params), endgame_budget=0,
+                                 batch_score=batch_score_wrap(family, params) if mode == 'batch' else None)
+        player.time_left = lambda: float('inf')
+        positions = random_positions(player, 'opponent', num_positions, plies // 2 * 2, seed)
+        chosen = []
+        start = time.time()
+        for i, game in enumerate(positions):
+            # Same move ordering in both modes
+            random.seed(seed + i)
+            chosen.append(player.alphabeta(game, depth))
+        results[mode] = time.time() - start
+        moves[mode] = chosen
+    results['same_moves'] = moves['scalar'] == moves['batch']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--positions', type=int, default=20)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--plies', type=int, default=8)
+    parser.add_argument('--family', choices=FAMILIES, default='div')
+    parser.add_argument('--params', type=float, nargs=2, default=(1., 1.))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    results = benchmark(args.positions, args.depth, args.plies, args.family,
+                        tuple(args.params), args.seed)
+    print("scalar {:.3f}s | batch {:.3f}s  (speedup {:.2f}x, same moves: {})".format(
+        results['scalar'], results['batch'], results['scalar'] / results['batch'],
+        results['same_moves']))
+
+
+if __name__ == "__main__":
+    main()
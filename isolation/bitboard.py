@@ -0,0 +1,71 @@
+"""Integer bitmask view of an Isolation board.
+
+Cell `(row, col)` is bit `row * width + col`. A position is described by the
+mask of blank cells plus the cell indices of the active and inactive players
+(None before a player's first move), which is all the search helpers in this
+package need to reason about a game without copying `isolation.Board`
+objects.
+"""
+from functools import lru_cache
+
+DIRECTIONS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
+              (1, -2), (1, 2), (2, -1), (2, 1)]
+
+
+def to_index(move, width):
+    return move[0] * width + move[1]
+
+
+def to_move(index, width):
+    return divmod(index, width)
+
+
+@lru_cache(maxsize=None)
+def knight_neighbors(width, height):
+    """Tuple of neighbour index tuples, one per cell, for knight moves."""
+    neighbors = []
+    for r in range(height):
+        for c in range(width):
+            neighbors.append(tuple((r + dr) * width + (c + dc) for dr, dc in DIRECTIONS
+                                   if 0 <= r + dr < height and 0 <= c + dc < width))
+    return tuple(neighbors)
+
+
+@lru_cache(maxsize=None)
+def knight_masks(width, height):
+    """Tuple of neighbour bitmasks, one per cell, for knight moves."""
+    return tuple(sum(1 << n for n in cells) for cells in knight_neighbors(width, height))
+
+
+def blank_mask(game):
+    mask = 0
+    for move in game.get_blank_spaces():
+        mask |= 1 << to_index(move, game.width)
+    return mask
+
+
+def location(game, player):
+    loc = game.get_player_location(player)
+    return None if loc is None else to_index(loc, game.width)
+
+
+def board_masks(game):
+    """(blank mask, active player index, inactive player index) of a board."""
+    return (blank_mask(game), location(game, game.active_player),
+            location(game, game.inactive_player))
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+def moves_mask(loc, blanks, masks):
+    """Blank cells reachable from `loc`; every blank cell before the first move."""
+    return blanks if loc is None else masks[loc] & blanks
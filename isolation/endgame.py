@@ -0,0 +1,139 @@
+"""Exact endgame play for partitioned Isolation boards.
+
+Once no blank cell can be reached by both players, the players can no
+longer interfere with each other and the game is decided by who can make
+more moves in their own region: the player to move wins only if their
+longest knight's path is strictly longer than the opponent's. Longest paths
+are found by depth-first search over (location, remaining blanks) states
+with memoization, under a node and time budget so that a region too large
+to solve hands control back to the normal search.
+"""
+from bitboard import board_masks, iter_bits, knight_masks, popcount, to_move
+
+
+class _OutOfBudget(Exception):
+    pass
+
+
+def reachable(loc, blanks, masks):
+    """Mask of blank cells reachable from `loc` by any sequence of knight moves."""
+    region = 0
+    frontier = masks[loc] & blanks
+    while frontier:
+        region |= frontier
+        step = 0
+        for cell in iter_bits(frontier):
+            step |= masks[cell]
+        frontier = step & blanks & ~region
+    return region
+
+
+def regions(game):
+    """Reachable regions of the active and inactive players, or None if a
+    player has not been placed yet or the regions still overlap.
+    """
+    blanks, active, inactive = board_masks(game)
+    if active is None or inactive is None:
+        return None
+    masks = knight_masks(game.width, game.height)
+    own = reachable(active, blanks, masks)
+    opp = reachable(inactive, blanks, masks)
+    if own & opp:
+        return None
+    return (active, own), (inactive, opp)
+
+
+class EndgameSolver():
+    """Longest-path solver used by `AlphaBetaPlayer` on partitioned boards.
+
+    Parameters
+    ----------
+    node_budget : int
+        Maximum number of search nodes per call to `solve`.
+
+    memo_size : int
+        The memo table is cleared when it grows past this many entries.
+        Entries do not depend on the game they came from, so the table is
+        shared across moves and games on boards of the same size.
+    """
+
+    def __init__(self, node_budget=50000, memo_size=500000):
+        self.node_budget = node_budget
+        self.memo_size = memo_size
+        self.memo = {}
+        self.size = None
+
+    def solve(self, game, time_left=None, time_threshold=0.):
+        """Solve a partitioned position.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            Position with the player to move active.
+
+        time_left : callable (optional)
+            Milliseconds left in the turn; the solver gives up once it drops
+            below `time_threshold`.
+
+        Returns
+        -------
+        ((int, int), int, int) or None
+            The first move of the active player's longest path and the path
+            lengths of the active and inactive players; None if the board is
+            not partitioned or the budget ran out first. The active player
+            wins iff the first length is greater than the second.
+        """
+        parts = regions(game)
+        if parts is None:
+            return None
+        (own_loc, own_region), (opp_loc, opp_region) = parts
+
+        if self.size != (game.width, game.height) or len(self.memo) > self.memo_size:
+            self.memo = {}
+            self.size = (game.width, game.height)
+        self._masks = knight_masks(game.width, game.height)
+        self._nodes = 0
+        self._time_left = time_left
+        self._threshold = time_threshold
+
+        try:
+            own, move = self._best(own_loc, own_region)
+            opp = self._longest(opp_loc, opp_region)
+        except _OutOfBudget:
+            return None
+        if move is None:
+            return (-1, -1), 0, opp
+        return to_move(move, game.width), own, opp
+
+    def _best(self, loc, blanks):
+        best, best_move = 0, None
+        for cell in iter_bits(self._masks[loc] & blanks):
+            length = 1 + self._longest(cell, blanks & ~(1 << cell))
+            if length > best:
+                best, best_move = length, cell
+        return best, best_move
+
+    def _longest(self, loc, blanks):
+        key = (loc, blanks)
+        found = self.memo.get(key)
+        if found is not None:
+            return found
+
+        self._nodes += 1
+        if self._nodes > self.node_budget:
+            raise _OutOfBudget()
+        if (self._time_left is not None and not self._nodes & 0xff and
+                self._time_left() < self._threshold):
+            raise _OutOfBudget()
+
+        best = 0
+        bound = popcount(blanks)
+        for cell in iter_bits(self._masks[loc] & blanks):
+            length = 1 + self._longest(cell, blanks & ~(1 << cell))
+            if length > best:
+                best = length
+                # No path can visit more cells than there are blanks left
+                if best == bound:
+                    break
+        self.memo[key] = best
+        return best
@@ -1,4 +1,12 @@
+import json
 import random
+from collections import OrderedDict
+
+from endgame import EndgameSolver
+from symmetry import SymmetryHasher
+
+# Transposition table entry flags
+EXACT, LOWER, UPPER = 0, 1, 2
 
 class SearchTimeout(Exception):
     """Subclass base exception for code clarity. """
@@ -351,13 +359,166 @@ class MinimaxPlayer(IsolationPlayer):
 
         return v
 
+class SearchStats():
+    """Search statistics of one `AlphaBetaPlayer.get_move` call.
+
+    The counters hold the iteration of iterative deepening in progress; each
+    finished (or timed out) iteration is appended to `iterations` as a dict
+    with its depth, node, leaf and cutoff counts, the share of cutoffs caused
+    by the first move searched, the number of forced-line extensions and
+    late-move reductions, transposition table hits, the effective branching factor
+    (nodes ** (1 / depth)) and the time spent.
+
+    Parameters
+    ----------
+    time_left : float (optional)
+        Milliseconds left in the turn when the search started.
+    """
+
+    def __init__(self, time_left=None):
+        self.start = time_left
+        self.source = 'search'
+        self.move = None
+        self.time_ms = 0.
+        self.iterations = []
+        self.begin_iteration(0, time_left)
+
+    def begin_iteration(self, depth, time_left):
+        self.depth = depth
+        self.iteration_start = time_left
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_cutoffs = 0
+        self.extensions = 0
+        self.reductions = 0
+        self.tt_hits = 0
+
+    def end_iteration(self, time_left, completed=True):
+        self.iterations.append(OrderedDict([
+            ('depth', self.depth),
+            ('completed', completed),
+            ('nodes', self.nodes),
+            ('leaves', self.leaves),
+            ('cutoffs', self.cutoffs),
+            ('first_move_cutoff_rate', float(self.first_cutoffs) / self.cutoffs if self.cutoffs else 0.),
+            ('extensions', self.extensions),
+            ('reductions', self.reductions),
+            ('tt_hits', self.tt_hits),
+            ('branching_factor', self.nodes ** (1. / self.depth) if self.depth else 0.),
+            ('time_ms', self.iteration_start - time_left),
+        ]))
+
+    def finish(self, move, time_left):
+        self.move = move
+        if self.start is not None:
+            self.time_ms = self.start - time_left
+
+    @property
+    def depth_reached(self):
+        """Depth of the deepest completed iteration."""
+        return max([it['depth'] for it in self.iterations if it['completed']] or [0])
+
+    @property
+    def total_nodes(self):
+        return sum(it['nodes'] for it in self.iterations)
+
+    @property
+    def nodes_per_sec(self):
+        return 1000. * self.total_nodes / self.time_ms if self.time_ms > 0 else 0.
+
+    def as_dict(self):
+        return OrderedDict([
+            ('source', self.source),
+            ('move', self.move),
+            ('depth_reached', self.depth_reached),
+            ('nodes', self.total_nodes),
+            ('nodes_per_sec', self.nodes_per_sec),
+            ('time_ms', self.time_ms),
+            ('iterations', self.iterations),
+        ])
+
+
 class AlphaBetaPlayer(IsolationPlayer):
     """Game-playing agent that chooses a move using iterative deepening minimax
     search with alpha-beta pruning. You must finish and test this player to
     make sure it returns a good move before the search time limit expires.
+
+    Parameters
+    ----------
+    opening_book : `opening_book.OpeningBook` (optional)
+        Book consulted before searching; positions it covers are answered
+        without spending any of the time budget.
+
+    endgame_budget : int (optional)
+        Node budget of the exact endgame solver that takes over once the
+        players are in separate regions of the board; None (the default) or
+        0 disables it. The solver may spend up to half of the time left on a
+        move before iterative deepening starts, so it only pays off when its
+        budget is large enough to solve the regions that arise.
+
+    stats_log : str (optional)
+        Path of a JSON lines file for the `SearchStats` of every move. Moves
+        only collect their records in `pending_stats`; `save_stats` appends
+        them to the file and is meant to be called outside the timed
+        `get_move` call (e.g. after each game), so disk I/O never counts
+        against the move clock. The statistics of the last move are always
+        available as `last_stats`.
+
+    extension_budget : int
+        Extra plies a path may be searched beyond the nominal depth while the
+        player to move has at most `forced_moves` legal moves (a quiescence
+        search over forced lines). 0 disables extensions.
+
+    forced_moves : int
+        Mobility at or below which a horizon node is extended.
+
+    lmr_depth : int
+        Minimum remaining depth at which late-move reductions apply; 0
+        disables them. Quiet moves (landing on a square the opponent cannot
+        reach) after the first `lmr_after` moves of a node are searched one
+        ply shallower, and re-searched at full depth only if they improve on
+        the current bound.
+
+    lmr_after : int
+        Number of moves per node always searched at full depth.
+
+    transposition_size : int
+        Number of entries of the transposition table, which is keyed by a
+        hash that is the same for all rotations/reflections of a position
+        (see `symmetry.SymmetryHasher`); 0 disables it. Sharing entries
+        between symmetric positions assumes `score_fn` is symmetric too, as
+        the mobility-based scores are.
+
+    batch_score : callable (optional)
+        Function `batch_score(game, moves, player)` returning the scores of
+        the positions after each of `moves`, e.g. from
+        `batch_eval.batch_score_wrap`. When given, nodes one ply above the
+        horizon evaluate all their children in one call instead of calling
+        `score_fn` per leaf; it must agree with `score_fn`, which still
+        scores the leaves of extended lines.
     """
 
-    def get_move(self, game, time_left, tree=None):
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=15., opening_book=None,
+                 endgame_budget=None, stats_log=None, extension_budget=0, forced_moves=2,
+                 lmr_depth=0, lmr_after=3, transposition_size=0, batch_score=None):
+        IsolationPlayer.__init__(self, search_depth, score_fn, timeout)
+        self.opening_book = opening_book
+        self.endgame = EndgameSolver(endgame_budget) if endgame_budget else None
+        self.extension_budget = extension_budget
+        self.forced_moves = forced_moves
+        self.lmr_depth = lmr_depth
+        self.lmr_after = lmr_after
+        self.transposition_size = transposition_size
+        self.tt = {} if transposition_size else None
+        self.hasher = None
+        self.batch_score = batch_score
+        self.stats_log = stats_log
+        self.stats = SearchStats()
+        self.last_stats = None
+        self.pending_stats = []
+
+    def get_move(self, game, time_left):
         """Search for the best move from the available legal moves and return a
         result before the time limit expires.
 
@@ -388,6 +549,41 @@ class AlphaBetaPlayer(IsolationPlayer):
             (-1, -1) if there are no available legal moves.
         """
         self.time_left = time_left
+        self.stats = SearchStats(time_left())
+
+        best_move = self._choose_move(game)
+
+        self.stats.finish(best_move, time_left())
+        self.last_stats = self.stats
+        if self.stats_log is not None:
+            self.pending_stats.append(self.stats)
+        return best_move
+
+    def save_stats(self):
+        """Append the records collected since the last call to `stats_log`."""
+        if self.stats_log is None or not self.pending_stats:
+            return
+        with open(self.stats_log, 'a') as f:
+            for stats in self.pending_stats:
+                f.write(json.dumps(stats.as_dict()) + '\n')
+        self.pending_stats = []
+
+    def _choose_move(self, game):
+        # Play the stored move if the opening book covers this position
+        if self.opening_book is not None:
+            book_move = self.opening_book.lookup(game)
+            if book_move is not None:
+                self.stats.source = 'book'
+                return book_move
+
+        # Once the players are cut off from each other, play the longest path
+        # found by the endgame solver; it may use up to half of the time left
+        if self.endgame is not None:
+            reserve = (self.time_left() + self.TIMER_THRESHOLD) / 2
+            solved = self.endgame.solve(game, self.time_left, reserve)
+            if solved is not None:
+                self.stats.source = 'endgame'
+                return solved[0]
 
         # Initialize the best move so that this function returns something
         # in case the search fails due to timeout
@@ -398,18 +594,21 @@ class AlphaBetaPlayer(IsolationPlayer):
             # The try/except block will automatically catch the exception
             # raised when the timer is about to expire.
             while self.time_left() > self.TIMER_THRESHOLD:
+                self.stats.begin_iteration(depth, self.time_left())
                 # Memorize last valid move
                 best_move = self.alphabeta(game, depth)
+                self.stats.end_iteration(self.time_left())
                 # Increase depth if we still have time
                 depth += 1
 
         except SearchTimeout:
-            pass  # Handle any actions required after timeout as needed
+            # Handle any actions required after timeout as needed
+            self.stats.end_iteration(self.time_left(), completed=False)
 
         # Return the best move from the last completed search iteration
         return best_move
 
-    def alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf"), tree=None):
+    def alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf")):
         """Implement depth-limited minimax search with alpha-beta pruning as
         described in the lectures.
 
@@ -457,6 +656,7 @@ class AlphaBetaPlayer(IsolationPlayer):
 
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
+        self.stats.nodes += 1
 
         # Forfeit game if no legal moves left
         legal_moves = game.get_legal_moves()
@@ -467,11 +667,14 @@ class AlphaBetaPlayer(IsolationPlayer):
         best_move = legal_moves[0]
         #scores = dict()
 
+        hstate = self.hash_state(game) if self.tt is not None else None
+
         # Initiate depth-first search and store scores & moves
         # Returning the maximum of scores is equivalent to calling maxvalue
         # So we call minvalue inside the for loop
         for move in legal_moves:
-            v = self.minvalue(game.forecast_move(move), depth-1, alpha, beta)
+            child_hstate = self.hasher.child(hstate, move) if hstate is not None else None
+            v = self.minvalue(game.forecast_move(move), depth-1, alpha, beta, 0, child_hstate)
             #scores[move] = v
 
             # Memorize move and change lower limit if score is greater that previous ones
@@ -482,60 +685,184 @@ class AlphaBetaPlayer(IsolationPlayer):
         # Return move that has the greatest score associated with it
         return best_move
 
-    def maxvalue(self, game, depth, alpha, beta, tree=None):
+    def hash_state(self, game):
+        """Symmetry hash state of `game`, starting a new transposition table
+        if the board size changed.
+        """
+        if self.hasher is None or (self.hasher.width, self.hasher.height) != (game.width, game.height):
+            self.hasher = SymmetryHasher(game.width, game.height)
+            self.tt.clear()
+        return self.hasher.state(game)
+
+    def probe(self, hstate, is_max, depth, alpha, beta):
+        """Key of the node in the transposition table and the stored value if
+        it settles the node at this depth and window (else None).
+        """
+        key = SymmetryHasher.canonical(hstate) << 1 | is_max
+        entry = self.tt.get(key)
+        if entry is not None and entry[0] >= depth:
+            _, value, flag = entry
+            if (flag == EXACT or (flag == LOWER and value >= beta) or
+                    (flag == UPPER and value <= alpha)):
+                self.stats.tt_hits += 1
+                return key, value
+        return key, None
+
+    def store(self, key, depth, value, alpha, beta):
+        if len(self.tt) >= self.transposition_size:
+            self.tt.clear()
+        if value <= alpha:
+            flag = UPPER
+        elif value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.tt[key] = (depth, value, flag)
+
+    def frontier_scores(self, game, legal_moves, depth, extended):
+        """Scores of all children of a node one ply above the horizon from a
+        single `batch_score` call, or None where children are searched one by
+        one (no batch function, deeper nodes, or children that may still be
+        extended).
+        """
+        if self.batch_score is None or depth != 1 or extended < self.extension_budget:
+            return None
+        self.stats.nodes += len(legal_moves)
+        self.stats.leaves += len(legal_moves)
+        return self.batch_score(game, legal_moves, self)
+
+    def quiet_moves(self, game, legal_moves, depth):
+        """Moves of the active player eligible for late-move reduction: those
+        that do not take away a square the opponent could move to.
+        """
+        if not self.lmr_depth or depth < self.lmr_depth:
+            return ()
+        return set(legal_moves).difference(game.get_legal_moves(game.inactive_player))
+
+    def maxvalue(self, game, depth, alpha, beta, extended=0, hstate=None):
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
+        stats = self.stats
+        stats.nodes += 1
 
         # Return the outcome of the game if no legal moves left
         legal_moves = game.get_legal_moves()
         if not legal_moves:
             return game.utility(self)
 
-        # Return the result of the evaluation function if we are at a subtree leaf
+        # Return the result of the evaluation function if we are at a subtree leaf,
+        # unless the position is volatile (few moves left to the player to move):
+        # then follow the forced line for another ply while the budget allows
         if depth <= 0:
-            return self.score(game, self)
+            if extended >= self.extension_budget or len(legal_moves) > self.forced_moves:
+                stats.leaves += 1
+                return self.score(game, self)
+            stats.extensions += 1
+            depth, extended = 1, extended + 1
+
+        # Reuse an earlier search of this position (or a symmetric one)
+        if hstate is not None:
+            key, value = self.probe(hstate, True, depth, alpha, beta)
+            if value is not None:
+                return value
+        alpha_orig = alpha
+
+        scores = self.frontier_scores(game, legal_moves, depth, extended)
+        quiet = self.quiet_moves(game, legal_moves, depth)
 
         # Get the maximum score for each legal move - current player is self
         v = float("-inf")
-        for move in legal_moves:
-            v = max(v, self.minvalue(game.forecast_move(move), depth-1, alpha, beta))
+        for i, move in enumerate(legal_moves):
+            if scores is not None:
+                score = scores[i]
+            else:
+                board = game.forecast_move(move)
+                child = self.hasher.child(hstate, move) if hstate is not None else None
+                # Search late quiet moves one ply shallower; re-search at full
+                # depth only if the reduced search says the move raises alpha
+                if i >= self.lmr_after and move in quiet:
+                    stats.reductions += 1
+                    score = self.minvalue(board, depth-2, alpha, beta, extended, child)
+                    if score > alpha:
+                        score = self.minvalue(board, depth-1, alpha, beta, extended, child)
+                else:
+                    score = self.minvalue(board, depth-1, alpha, beta, extended, child)
+            v = max(v, score)
 
             # Prune all branches after this one if score is higher than the top limit
             # Reason: we have to chose the maximum score => if the next scores are greater, they will be > top limit; if they are lower => they do not matter
             # The top limit comes from a previous minvalue calculation
             if v >= beta:
-                return v
+                stats.cutoffs += 1
+                stats.first_cutoffs += i == 0
+                break
 
             # Move lowest limit to current score if the score is higher
             alpha = max(alpha, v)
 
+        if hstate is not None:
+            self.store(key, depth, v, alpha_orig, beta)
         return v
 
-    def minvalue(self, game, depth, alpha, beta, tree=None):
+    def minvalue(self, game, depth, alpha, beta, extended=0, hstate=None):
         if self.time_left() < self.TIMER_THRESHOLD:
             raise SearchTimeout()
+        stats = self.stats
+        stats.nodes += 1
 
         # Return the outcome of the game if no legal moves left
         legal_moves = game.get_legal_moves()
         if not legal_moves:
             return game.utility(self)
 
-        # Return the result of the evaluation function if we are at a subtree leaf
+        # Return the result of the evaluation function if we are at a subtree leaf,
+        # unless the position is volatile (see maxvalue)
         if depth <= 0:
-            return self.score(game, self)
+            if extended >= self.extension_budget or len(legal_moves) > self.forced_moves:
+                stats.leaves += 1
+                return self.score(game, self)
+            stats.extensions += 1
+            depth, extended = 1, extended + 1
+
+        # Reuse an earlier search of this position (or a symmetric one)
+        if hstate is not None:
+            key, value = self.probe(hstate, False, depth, alpha, beta)
+            if value is not None:
+                return value
+        beta_orig = beta
+
+        scores = self.frontier_scores(game, legal_moves, depth, extended)
+        quiet = self.quiet_moves(game, legal_moves, depth)
 
         # Get the minimum score for each legal move - current player is self's opponent
         v = float("inf")
-        for move in legal_moves:
-            v = min(v, self.maxvalue(game.forecast_move(move), depth-1, alpha, beta))
+        for i, move in enumerate(legal_moves):
+            if scores is not None:
+                score = scores[i]
+            else:
+                board = game.forecast_move(move)
+                child = self.hasher.child(hstate, move) if hstate is not None else None
+                # Late quiet moves: reduced search first, full depth if it lowers beta
+                if i >= self.lmr_after and move in quiet:
+                    stats.reductions += 1
+                    score = self.maxvalue(board, depth-2, alpha, beta, extended, child)
+                    if score < beta:
+                        score = self.maxvalue(board, depth-1, alpha, beta, extended, child)
+                else:
+                    score = self.maxvalue(board, depth-1, alpha, beta, extended, child)
+            v = min(v, score)
 
             # Prune all branches after this one if score is lower than the lowest limit
             # Reason: we have to chose the minimum score => if the next scores are lower, they will be < lowest limit; if they are higher => they do not matter
             # The lowest limit comes from a previous maxvalue calculation
             if v <= alpha:
-                return v
+                stats.cutoffs += 1
+                stats.first_cutoffs += i == 0
+                break
 
             # Move highest limit to current score if the score is lower
             beta = min(beta, v)
 
+        if hstate is not None:
+            self.store(key, depth, v, alpha, beta_orig)
         return v
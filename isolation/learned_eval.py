@@ -0,0 +1,225 @@
+"""Evaluation function learned from self-play records.
+
+`features` describes a position from one player's point of view with a few
+numbers (mobility, second-order mobility, the sizes of the regions each
+player can still reach, distance to the center, blank cells). A logistic
+regression fitted with NumPy on positions replayed from a `selfplay`
+`GameStore` predicts whether that player goes on to win. The exported score
+is the model's logit, so evaluating a position costs the feature extraction
+plus one dot product, and it orders positions the same way as the predicted
+win probability.
+
+Example
+-------
+    python learned_eval.py runs/selfplay --out learned_weights.json
+    # then: AlphaBetaPlayer(score_fn=learned_score_wrap(load_weights('learned_weights.json')))
+"""
+import argparse
+import json
+import math
+import random
+
+import numpy as np
+
+from bitboard import board_masks, iter_bits, knight_masks, moves_mask, popcount
+from endgame import reachable
+
+FEATURES = ['own_moves', 'opp_moves', 'own_moves_2', 'opp_moves_2',
+            'own_region', 'opp_region', 'own_center', 'opp_center', 'blanks']
+
+
+def second_moves(loc, blanks, masks):
+    """Blank cells reachable in exactly two knight moves over blank cells."""
+    if loc is None:
+        return blanks
+    cells = 0
+    for cell in iter_bits(masks[loc] & blanks):
+        cells |= masks[cell]
+    return cells & blanks
+
+
+def center_distance(loc, width, height):
+    if loc is None:
+        return 0.
+    r, c = divmod(loc, width)
+    return (height / 2. - r) ** 2 + (width / 2. - c) ** 2
+
+
+def features(blanks, own, opp, width, height):
+    """Feature vector (as a list, in `FEATURES` order) of a position given as
+    a blank mask and the cell indices of the player whose point of view is
+    taken and of its opponent (None before their first move).
+    """
+    masks = knight_masks(width, height)
+    own_region = blanks if own is None else reachable(own, blanks, masks)
+    opp_region = blanks if opp is None else reachable(opp, blanks, masks)
+    return [
+        popcount(moves_mask(own, blanks, masks)),
+        popcount(moves_mask(opp, blanks, masks)),
+        popcount(second_moves(own, blanks, masks)),
+        popcount(second_moves(opp, blanks, masks)),
+        popcount(own_region),
+        popcount(opp_region),
+        center_distance(own, width, height),
+        center_distance(opp, width, height),
+        popcount(blanks),
+    ]
+
+
+def game_features(game, player):
+    """`features` of an `isolation.Board` from the point of view of `player`."""
+    blanks, active, inactive = board_masks(game)
+    if player is not game.active_player:
+        active, inactive = inactive, active
+    return features(blanks, active, inactive, game.width, game.height)
+
+
+def training_set(store, width=7, height=7, outcomes=('normal',)):
+    """Positions replayed from a `selfplay.GameStore` with their labels.
+
+    Every position after both players have moved contributes two samples,
+    one from each player's point of view, labeled 1 for the eventual winner
+    and 0 for the loser. Games that ended any other way than in `outcomes`
+    (e.g. timeouts) are skipped.
+
+    Returns
+    -------
+    (ndarray, ndarray, ndarray)
+        Feature matrix, labels and the game id of every sample (for splits
+        that keep the positions of a game together).
+    """
+    games, moves = store.table('games'), store.table('moves')
+    keep = set(store.meta['outcomes'].index(name) for name in outcomes)
+    winners = dict((int(g), int(w)) for g, w, o in zip(games['game'], games['winner'],
+                                                       games['outcome']) if o in keep)
+    order = np.lexsort((moves['ply'], moves['game']))
+    X, y, ids = [], [], []
+    state = None
+    for i in order:
+        game_id = int(moves['game'][i])
+        if game_id not in winners:
+            continue
+        ply = int(moves['ply'][i])
+        if ply == 0:
+            state = ((1 << width * height) - 1, None, None)
+        blanks, active, inactive = state
+        if active is not None and inactive is not None:
+            mover_won = winners[game_id] == ply % 2 + 1
+            X.append(features(blanks, active, inactive, width, height))
+            X.append(features(blanks, inactive, active, width, height))
+            y.extend([float(mover_won), float(not mover_won)])
+            ids.extend([game_id, game_id])
+        r, c = int(moves['row'][i]), int(moves['col'][i])
+        if r < 0:
+            continue
+        cell = r * width + c
+        state = (blanks & ~(1 << cell), inactive, cell)
+    return np.array(X, dtype=float).reshape(-1, len(FEATURES)), np.array(y), np.array(ids)
+
+
+def fit_logistic(X, y, l2=1e-3, learning_rate=0.5, epochs=2000):
+    """L2-regularized logistic regression by full-batch gradient descent on
+    standardized features.
+
+    Returns
+    -------
+    dict
+        Weights in the original feature scale, so that the logit of a
+        position is `bias + dot(weights, features)`.
+    """
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.
+    Z = (X - mean) / std
+    w = np.zeros(Z.shape[1])
+    b = 0.
+    for _ in range(epochs):
+        p = 1. / (1. + np.exp(-(Z.dot(w) + b)))
+        error = p - y
+        w -= learning_rate * (Z.T.dot(error) / len(y) + l2 * w)
+        b -= learning_rate * error.mean()
+    weights = w / std
+    return {'features': FEATURES, 'weights': weights.tolist(),
+            'bias': float(b - weights.dot(mean))}
+
+
+def accuracy(model, X, y):
+    logits = X.dot(np.array(model['weights'])) + model['bias']
+    return float(((logits > 0) == (y > 0.5)).mean())
+
+
+def save_weights(model, path):
+    with open(path, 'w') as f:
+        json.dump(model, f, indent=2)
+
+
+def load_weights(path):
+    with open(path) as f:
+        model = json.load(f)
+    if model['features'] != FEATURES:
+        raise ValueError("Weights were trained on features {}".format(model['features']))
+    return model
+
+
+def learned_score_wrap(model):
+    """Score function returning the logit of the model's win probability
+    for `player`, like the `*_score_wrap` factories in `game_agent`.
+    """
+    weights = list(model['weights'])
+    bias = model['bias']
+
+    def learned_score(game, player):
+        if game.is_loser(player):
+            return float("-inf")
+
+        if game.is_winner(player):
+            return float("inf")
+
+        return bias + sum(w * f for w, f in zip(weights, game_features(game, player)))
+    return learned_score
+
+
+def train(store, validation=0.2, seed=0, **fit_kwargs):
+    """Fit a model on a `GameStore`, holding out a share of its games.
+
+    Returns
+    -------
+    (dict, float, float)
+        The model and its training and validation accuracy.
+    """
+    X, y, ids = training_set(store)
+    if not len(y):
+        raise ValueError("No finished games in the store")
+    games = sorted(set(ids.tolist()))
+    random.Random(seed).shuffle(games)
+    held_out = np.isin(ids, games[:int(math.ceil(validation * len(games)))])
+    if held_out.all():
+        held_out[:] = False
+    model = fit_logistic(X[~held_out], y[~held_out], **fit_kwargs)
+    val = accuracy(model, X[held_out], y[held_out]) if held_out.any() else float('nan')
+    return model, accuracy(model, X[~held_out], y[~held_out]), val
+
+
+def main():
+    from selfplay import GameStore
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('store', help="selfplay GameStore directory")
+    parser.add_argument('--out', default='learned_weights.json')
+    parser.add_argument('--l2', type=float, default=1e-3)
+    parser.add_argument('--epochs', type=int, default=2000)
+    parser.add_argument('--validation', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    model, train_acc, val_acc = train(GameStore(args.store), args.validation, args.seed,
+                                      l2=args.l2, epochs=args.epochs)
+    save_weights(model, args.out)
+    print("train accuracy {:.3f} | validation accuracy {:.3f}".format(train_acc, val_acc))
+    for name, w in zip(model['features'], model['weights']):
+        print("{:<12} {:+.4f}".format(name, w))
+    print("{:<12} {:+.4f}".format('bias', model['bias']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""Monte Carlo Tree Search player for Isolation.
+
+`MCTSPlayer` runs UCT on the bitmask representation from `bitboard`, so
+playouts never touch `isolation.Board`. The subtree under the move that was
+actually played is kept between turns, and with `processes > 1` extra
+independent trees are grown in worker processes (root parallelization) and
+their root statistics merged with the local tree before picking a move.
+
+Nodes hold no parent links (backpropagation walks the path recorded during
+selection), and the cyclic garbage collector is paused while a tree is
+searched: a collection pass over a tree kept across turns can take tens of
+milliseconds, enough to push a move past its time limit.
+
+Example
+-------
+    python mcts.py --games 20 --time-limit 150
+"""
+import argparse
+import gc
+import math
+import multiprocessing
+import random
+import time
+
+from bitboard import board_masks, knight_neighbors, to_move
+from game_agent import IsolationPlayer
+
+
+class Node():
+    """Tree node. `wins` counts playouts won by the player who made `move`."""
+
+    __slots__ = ('move', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, move, untried):
+        self.move = move
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.
+
+
+def legal_moves(state, neighbors):
+    blanks, active, _ = state
+    if active is None:
+        return [i for i in range(len(neighbors)) if blanks >> i & 1]
+    return [n for n in neighbors[active] if blanks >> n & 1]
+
+
+def apply_move(state, move):
+    blanks, active, inactive = state
+    return blanks & ~(1 << move), inactive, move
+
+
+def playout(state, neighbors, rng, guided=0.):
+    """Play random moves to the end of the game.
+
+    With probability `guided` a move is chosen greedily to maximize the
+    mover's onward mobility instead of uniformly at random.
+
+    Returns
+    -------
+    bool
+        True if the player to move in `state` wins.
+    """
+    blanks, active, inactive = state
+    to_move_wins = False
+    while True:
+        if active is None:
+            moves = [i for i in range(len(neighbors)) if blanks >> i & 1]
+        else:
+            moves = [n for n in neighbors[active] if blanks >> n & 1]
+        if not moves:
+            return to_move_wins
+        if guided and rng.random() < guided:
+            move = max(moves, key=lambda m: sum(blanks >> n & 1 for n in neighbors[m]))
+        else:
+            move = moves[int(rng.random() * len(moves))]
+        blanks &= ~(1 << move)
+        active, inactive = inactive, move
+        to_move_wins = not to_move_wins
+
+
+def search(root, state, neighbors, rng, deadline, c=1.4, guided=0.):
+    """Grow the tree under `root` until `time.time()` reaches `deadline`.
+
+    Returns the number of playouts run.
+    """
+    playouts = 0
+    while time.time() < deadline:
+        node, s = root, state
+        path = [root]
+
+        # Selection
+        while not node.untried and node.children:
+            log_n = math.log(node.visits)
+            node = max(node.children, key=lambda child: child.wins / child.visits +
+                       c * math.sqrt(log_n / child.visits))
+            s = apply_move(s, node.move)
+            path.append(node)
+
+        # Long selections on a big tree can overrun the deadline by
+        # themselves; drop the iteration rather than add a playout
+        if time.time() >= deadline:
+            break
+
+        # Expansion
+        if node.untried:
+            move = node.untried.pop(int(rng.random() * len(node.untried)))
+            s = apply_move(s, move)
+            child = Node(move, legal_moves(s, neighbors))
+            node.children.append(child)
+            path.append(child)
+
+        # Simulation, then backpropagation: `node.wins` is for the player who
+        # moved into `node`, i.e. the one *not* to move in `s`
+        won = not playout(s, neighbors, rng, guided)
+        for node in reversed(path):
+            node.visits += 1
+            node.wins += won
+            won = not won
+        playouts += 1
+    return playouts
+
+
+def _root_search(args):
+    state, width, height, deadline, seed, c, guided = args
+    neighbors = knight_neighbors(width, height)
+    root = Node(None, legal_moves(state, neighbors))
+    root.visits = 1
+    playouts = search(root, state, neighbors, random.Random(seed), deadline, c, guided)
+    return dict((child.move, (child.visits, child.wins)) for child in root.children), playouts
+
+
+class MCTSPlayer(IsolationPlayer):
+    """Game-playing agent that chooses a move with UCT Monte Carlo Tree Search.
+
+    Parameters
+    ----------
+    c : float
+        UCT exploration constant.
+
+    guided : float
+        Probability of a greedy mobility move at each playout step.
+
+    processes : int
+        Number of trees grown in parallel; `processes - 1` of them run in a
+        worker pool. Players used inside a `multiprocessing` pool worker (e.g.
+        by `param_sweep`) must keep the default of 1.
+
+    seed : int (optional)
+        Seed of the playout random generators.
+    """
+
+    def __init__(self, timeout=15., c=1.4, guided=0., processes=1, seed=None):
+        IsolationPlayer.__init__(self, timeout=timeout)
+        self.c = c
+        self.guided = guided
+        self.processes = processes
+        self.rng = random.Random(seed)
+        # Started up front: forking workers inside get_move would eat the
+        # time budget of the first move
+        self.pool = multiprocessing.Pool(processes - 1) if processes > 1 else None
+        self.root = None
+        self.root_state = None
+        self.playouts = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pool'] = None
+        return state
+
+    def get_move(self, game, time_left):
+        """Search for the best move from the available legal moves and return a
+        result before the time limit expires.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game (e.g., player locations and blocked cells).
+
+        time_left : callable
+            A function that returns the number of milliseconds left in the
+            current turn. Returning with any less than 0 ms remaining forfeits
+            the game.
+
+        Returns
+        -------
+        (int, int)
+            Board coordinates corresponding to a legal move; may return
+            (-1, -1) if there are no available legal moves.
+        """
+        self.time_left = time_left
+        neighbors = knight_neighbors(game.width, game.height)
+        state = board_masks(game)
+        root = self._reuse(state, neighbors)
+        if not root.untried and not root.children:
+            self.root = None
+            return (-1, -1)
+
+        # Leave a margin of three thresholds: one for the search to notice
+        # the deadline, one to merge worker results and one to return
+        budget = (self.time_left() - 3 * self.TIMER_THRESHOLD) / 1000.
+        deadline = time.time() + max(0., budget)
+
+        pending = None
+        if self.pool is not None:
+            # Workers stop a little earlier so their results are back in time
+            worker_deadline = deadline - self.TIMER_THRESHOLD / 2000.
+            jobs = [(state, game.width, game.height, worker_deadline, self.rng.getrandbits(32),
+                     self.c, self.guided) for _ in range(self.processes - 1)]
+            pending = self.pool.map_async(_root_search, jobs)
+
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self.playouts = search(root, state, neighbors, self.rng, deadline, self.c, self.guided)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        totals = dict((child.move, child.visits) for child in root.children)
+        if pending is not None:
+            wait = max(0., (self.time_left() - 1.5 * self.TIMER_THRESHOLD) / 1000.)
+            try:
+                for stats, playouts in pending.get(wait):
+                    self.playouts += playouts
+                    for move, (visits, _) in stats.items():
+                        totals[move] = totals.get(move, 0) + visits
+            except multiprocessing.TimeoutError:
+                pass
+
+        if not totals:
+            move = root.untried[0]
+        else:
+            move = max(totals, key=totals.get)
+
+        # Keep the chosen subtree for the next turn
+        self.root = next((child for child in root.children if child.move == move), None)
+        self.root_state = apply_move(state, move)
+        return to_move(move, game.width)
+
+    def _reuse(self, state, neighbors):
+        """Subtree matching `state` from the previous turn, or a new root."""
+        root = None
+        if self.root is not None:
+            for child in self.root.children:
+                if apply_move(self.root_state, child.move) == state:
+                    root = child
+                    break
+        if root is None:
+            root = Node(None, legal_moves(state, neighbors))
+        root.visits = max(root.visits, 1)
+        return root
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+
+def timing_check(games=20, time_limit=150, opponent='AB_Improved'):
+    """Play `MCTS` against `opponent` under the tournament time limit and
+    return the number of games it lost on time or by forfeit, together with
+    its slowest move in milliseconds.
+    """
+    from selfplay import play_game
+
+    losses, slowest = 0, 0.
+    for game_id in range(games):
+        first = game_id % 2 == 0
+        names = ('MCTS', opponent) if first else (opponent, 'MCTS')
+        row, moves = play_game((game_id, names[0], names[1], 0, game_id), time_limit)
+        # MCTS moves on even plies when it moves first
+        own = [m[4] for m in moves if m[1] % 2 == (0 if first else 1) and m[4] == m[4]]
+        slowest = max([slowest] + own)
+        mcts_lost = row[4] == (2 if first else 1)
+        if row[5] != 'normal' and mcts_lost:
+            losses += 1
+    return losses, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that MCTSPlayer never loses on time")
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--time-limit', type=float, default=150.)
+    parser.add_argument('--opponent', default='AB_Improved')
+    args = parser.parse_args()
+
+    losses, slowest = timing_check(args.games, args.time_limit, args.opponent)
+    print("{} games: {} timeouts/forfeits, slowest move {:.1f} ms of {:.0f}".format(
+        args.games, losses, slowest, args.time_limit))
+    if losses:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
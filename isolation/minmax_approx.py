@@ -0,0 +1,271 @@
+"""Best-first search by min/max approximation (Rivest, 1987).
+
+See `articles/GameTreeSearchByMinMaxApprox.md`. Instead of searching the
+tree depth first, `MinMaxApproxPlayer` keeps an explicit tree and repeatedly
+expands the leaf on which the root value depends most. Node values are
+backed up with generalized p-means, a smooth stand-in for max (p > 0) and
+min (p < 0), and the penalty of an edge is the negative log of the
+derivative of the parent's mean with respect to the child, plus a constant
+cost per ply. The leaf with the smallest path penalty is expanded next. As
+in the paper ("reverse approximation"), moves are still chosen on the true
+backed-up minimax values.
+
+The tree lives in parallel lists indexed by node id, with the children of a
+node stored contiguously, so there is no per-node object.
+
+Example
+-------
+    python minmax_approx.py --matches 20 --time-limit 150 --nodes 2000
+"""
+import argparse
+import math
+import random
+
+from isolation import Board
+
+from game_agent import AlphaBetaPlayer, IsolationPlayer, SearchTimeout, custom_score
+
+EPSILON = 1e-6
+
+
+def squash(score, scale):
+    """Map a heuristic score (possibly +/-inf) into (0, 1) for the p-means."""
+    if score == float('inf'):
+        return 1. - EPSILON
+    if score == float('-inf'):
+        return EPSILON
+    x = max(-50., min(50., score / scale))
+    return min(1. - EPSILON, max(EPSILON, 1. / (1. + math.exp(-x))))
+
+
+class MinMaxApproxPlayer(IsolationPlayer):
+    """Game-playing agent that chooses a move with best-first min/max
+    approximation search.
+
+    Parameters
+    ----------
+    p : float
+        Exponent of the generalized mean; larger values follow max/min more
+        closely and make the search more selective.
+
+    edge_cost : float
+        Constant penalty added to every edge, which keeps the search from
+        running arbitrarily deep along a single line.
+
+    scale : float
+        Divisor applied to scores before squashing them into (0, 1).
+
+    node_budget : int (optional)
+        Maximum number of evaluated nodes per move, in addition to the time
+        limit.
+    """
+
+    def __init__(self, score_fn=custom_score, timeout=15., p=10., edge_cost=0.05, scale=2.,
+                 node_budget=None):
+        IsolationPlayer.__init__(self, score_fn=score_fn, timeout=timeout)
+        self.p = p
+        self.edge_cost = edge_cost
+        self.scale = scale
+        self.node_budget = node_budget
+        self.nodes = 0
+
+    def get_move(self, game, time_left):
+        """Search for the best move from the available legal moves and return a
+        result before the time limit expires.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game (e.g., player locations and blocked cells).
+
+        time_left : callable
+            A function that returns the number of milliseconds left in the
+            current turn. Returning with any less than 0 ms remaining forfeits
+            the game.
+
+        Returns
+        -------
+        (int, int)
+            Board coordinates corresponding to a legal move; may return
+            (-1, -1) if there are no available legal moves.
+        """
+        self.time_left = time_left
+        legal_moves = game.get_legal_moves()
+        if not legal_moves:
+            return (-1, -1)
+
+        self._reset(game)
+        try:
+            self._expand(0, legal_moves)
+            while self.best[0] != float('inf'):
+                if self.node_budget is not None and self.nodes >= self.node_budget:
+                    break
+                leaf = self._select()
+                self._expand(leaf, self.boards[leaf].get_legal_moves())
+        except SearchTimeout:
+            pass
+
+        first, count = self.first[0], self.count[0]
+        if count == 0:
+            return legal_moves[0]
+        best = max(range(first, first + count), key=lambda i: self.value[i])
+        return self.move[best]
+
+    def _reset(self, game):
+        self.nodes = 0
+        # Parallel arrays: one entry per node, children of a node contiguous
+        self.parent = [-1]
+        self.move = [None]
+        self.is_max = [True]
+        self.first = [0]
+        self.count = [0]
+        self.value = [0.]       # true minimax value (squashed)
+        self.approx = [0.5]     # generalized-mean value
+        self.best = [0.]        # penalty of the best leaf below this node
+        self.best_child = [0]   # child on the path to that leaf
+        self.boards = [game]    # positions of unexpanded nodes only
+
+    def _select(self):
+        """Descend from the root along the children of least penalty."""
+        node = 0
+        while self.count[node]:
+            node = self.best_child[node]
+        return node
+
+    def _expand(self, node, legal_moves):
+        if self.time_left() < self.TIMER_THRESHOLD:
+            raise SearchTimeout()
+
+        board = self.boards[node]
+        self.boards[node] = None
+        self.first[node] = len(self.parent)
+        self.count[node] = len(legal_moves)
+        child_max = not self.is_max[node]
+
+        for move in legal_moves:
+            child = board.forecast_move(move)
+            child_moves = child.get_legal_moves()
+            if not child_moves:
+                score = child.utility(self)
+            else:
+                score = self.score(child, self)
+            v = squash(score, self.scale)
+            self.parent.append(node)
+            self.move.append(move)
+            self.is_max.append(child_max)
+            self.first.append(0)
+            self.count.append(0)
+            self.value.append(v)
+            self.approx.append(v)
+            # Terminal positions can not be expanded any further
+            self.best.append(float('inf') if not child_moves else 0.)
+            self.best_child.append(0)
+            self.boards.append(child if child_moves else None)
+            self.nodes += 1
+
+        # Back up values and penalties along the path to the root
+        while node >= 0:
+            self._backup(node)
+            node = self.parent[node]
+
+    def _backup(self, node):
+        first, count = self.first[node], self.count[node]
+        children = range(first, first + count)
+        p = self.p if self.is_max[node] else -self.p
+
+        values = [self.value[i] for i in children]
+        self.value[node] = max(values) if self.is_max[node] else min(values)
+
+        mean = (sum(self.approx[i] ** p for i in children) / count) ** (1. / p)
+        self.approx[node] = mean
+
+        # penalty = -log(d mean / d child) = log(n) + (1 - p) * log(child / mean)
+        log_n, log_mean = math.log(count), math.log(mean)
+        best, best_child = float('inf'), first
+        for i in children:
+            if self.best[i] == float('inf'):
+                continue
+            penalty = (log_n + (1. - p) * (math.log(self.approx[i]) - log_mean) +
+                       self.edge_cost + self.best[i])
+            if penalty < best:
+                best, best_child = penalty, i
+        self.best[node] = best
+        self.best_child[node] = best_child
+
+
+class NodeBudgetAlphaBetaPlayer(AlphaBetaPlayer):
+    """`AlphaBetaPlayer` that stops iterative deepening after `node_budget`
+    evaluations per move, for comparisons at equal node counts. The endgame
+    solver is off so that every move is found by the search itself.
+    """
+
+    def __init__(self, node_budget, score_fn=custom_score, timeout=15.):
+        AlphaBetaPlayer.__init__(self, score_fn=score_fn, timeout=timeout, endgame_budget=0)
+        self.node_budget = node_budget
+        self.nodes = 0
+        self._score = self.score
+        self.score = self._counted_score
+
+    def _counted_score(self, game, player):
+        self.nodes += 1
+        if self.nodes > self.node_budget:
+            raise SearchTimeout()
+        return self._score(game, player)
+
+    def get_move(self, game, time_left):
+        self.nodes = 0
+        return AlphaBetaPlayer.get_move(self, game, time_left)
+
+
+def benchmark(num_matches=10, time_limit=150, node_budget=None, score_fn=custom_score,
+              seed=0, **mm_kwargs):
+    """Play `MinMaxApproxPlayer` against `AlphaBetaPlayer` with the same
+    evaluation function, two games per match with swapped seats and a shared
+    random opening.
+
+    With `node_budget` set both players are limited to that many evaluations
+    per move (and still to `time_limit`); otherwise only time is limited.
+
+    Returns
+    -------
+    dict
+        Wins of each player and the number of timeouts.
+    """
+    random.seed(seed)
+    results = {'MM': 0, 'AB': 0, 'timeouts': 0}
+    for _ in range(num_matches):
+        mm = MinMaxApproxPlayer(score_fn=score_fn, node_budget=node_budget, **mm_kwargs)
+        if node_budget is None:
+            ab = AlphaBetaPlayer(score_fn=score_fn, endgame_budget=0)
+        else:
+            ab = NodeBudgetAlphaBetaPlayer(node_budget, score_fn=score_fn)
+        games = [Board(mm, ab), Board(ab, mm)]
+        for _ in range(2):
+            move = random.choice(games[0].get_legal_moves())
+            for game in games:
+                game.apply_move(move)
+        for game in games:
+            winner, _, outcome = game.play(time_limit=time_limit)
+            results['MM' if winner is mm else 'AB'] += 1
+            results['timeouts'] += outcome == 'timeout'
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--matches', type=int, default=10)
+    parser.add_argument('--time-limit', type=int, default=150)
+    parser.add_argument('--nodes', type=int, default=None)
+    parser.add_argument('--p', type=float, default=10.)
+    parser.add_argument('--edge-cost', type=float, default=0.05)
+    args = parser.parse_args()
+    results = benchmark(args.matches, args.time_limit, args.nodes,
+                        p=args.p, edge_cost=args.edge_cost)
+    total = results['MM'] + results['AB']
+    print("MM {} | {} AB  ({:.1f}% for MM, {} timeouts)".format(
+        results['MM'], results['AB'], 100. * results['MM'] / total, results['timeouts']))
+
+
+if __name__ == "__main__":
+    main()
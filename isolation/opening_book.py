@@ -0,0 +1,194 @@
+"""Opening book for Isolation, built offline by deep search.
+
+`build_book` enumerates every position of the first `plies` plies, folds
+positions that are rotations/reflections of each other into one entry, and
+searches each of them to a fixed depth (or for a fixed time) with
+`AlphaBetaPlayer`. The result is written as a flat table of fixed-size
+records sorted by position key, which `OpeningBook` memory-maps and
+binary-searches, so loading a book costs nothing and lookups touch a handful
+of pages.
+
+File layout (little endian):
+    header  '<4sBBBxI'  magic, width, height, plies, record count
+    record  '<QH'       canonical position key, best move cell index
+
+Example
+-------
+    python opening_book.py book_7x7.bin --plies 3 --depth 5
+    player = AlphaBetaPlayer(opening_book=OpeningBook('book_7x7.bin'))
+"""
+import argparse
+import mmap
+import random
+import struct
+import time
+
+from isolation import Board
+
+from bitboard import board_masks, to_index, to_move
+from game_agent import AlphaBetaPlayer, custom_score
+from symmetry import canonical_key, symmetries
+
+MAGIC = b'IOB1'
+HEADER = struct.Struct('<4sBBBxI')
+RECORD = struct.Struct('<QH')
+
+
+class OpeningBook():
+    """Read-only, memory-mapped opening book.
+
+    Parameters
+    ----------
+    path : str
+        File written by `build_book`.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.width, self.height, self.plies, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not an Isolation opening book".format(path))
+        self._perms = symmetries(self.width, self.height)
+        self._inverse = []
+        for perm in self._perms:
+            inv = [0] * len(perm)
+            for i, j in enumerate(perm):
+                inv[j] = i
+            self._inverse.append(inv)
+
+    def _find(self, key):
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, move = RECORD.unpack_from(self._map, HEADER.size + mid * RECORD.size)
+            if k == key:
+                return move
+            if k < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def lookup(self, game):
+        """Book move for the position on `game`, or None if the position is
+        not covered (wrong board size, too deep, or never reached in the build).
+        """
+        if (game.width, game.height) != (self.width, self.height) or game.move_count >= self.plies:
+            return None
+        key, s = canonical_key(*board_masks(game), perms=self._perms)
+        move = self._find(key)
+        if move is None:
+            return None
+        move = to_move(self._inverse[s][move], self.width)
+        return move if move in game.get_legal_moves() else None
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _search(player, game, depth, time_limit):
+    """Best move for the active player, searching each set of symmetric
+    root moves only once.
+    """
+    if time_limit:
+        start = time.time()
+        return player.get_move(game, lambda: 1000 * (time_limit - (time.time() - start)))
+
+    player.time_left = lambda: float('inf')
+    perms = symmetries(game.width, game.height)
+    alpha, best_move, seen = float('-inf'), None, set()
+    for move in game.get_legal_moves():
+        child = game.forecast_move(move)
+        key = canonical_key(*board_masks(child), perms=perms)[0]
+        if key in seen:
+            continue
+        seen.add(key)
+        v = player.minvalue(child, depth - 1, alpha, float('inf'))
+        if best_move is None or v > alpha:
+            alpha, best_move = v, move
+    return best_move
+
+
+def build_book(path, width=7, height=7, plies=3, depth=5, time_limit=None,
+               score_fn=custom_score, seed=0, verbose=True):
+    """Search every position of the first `plies` plies and write the book.
+
+    Parameters
+    ----------
+    path : str
+        Output file.
+
+    plies : int
+        Number of plies covered; a book with plies=3 answers the first move
+        of both players and the second move of the first player.
+
+    depth : int
+        Fixed search depth per position (ignored when `time_limit` is set).
+
+    time_limit : float (optional)
+        Seconds of iterative deepening per position instead of a fixed depth.
+
+    score_fn : callable
+        Evaluation function used by the search.
+
+    Returns
+    -------
+    int
+        Number of book entries written.
+    """
+    random.seed(seed)
+    size = width * height
+    if 2 * size.bit_length() + size > 64:
+        raise ValueError("board too large for 64 bit position keys")
+
+    players = (AlphaBetaPlayer(search_depth=depth, score_fn=score_fn),
+               AlphaBetaPlayer(search_depth=depth, score_fn=score_fn))
+    perms = symmetries(width, height)
+    frontier = {canonical_key((1 << size) - 1, None, None, perms)[0]:
+                Board(players[0], players[1], width, height)}
+    entries = {}
+
+    for ply in range(plies):
+        start = time.time()
+        next_frontier = {}
+        for key, game in frontier.items():
+            if not game.get_legal_moves():
+                continue
+            move = _search(game.active_player, game, depth, time_limit)
+            s = canonical_key(*board_masks(game), perms=perms)[1]
+            entries[key] = perms[s][to_index(move, width)]
+            if ply + 1 < plies:
+                for m in game.get_legal_moves():
+                    child = game.forecast_move(m)
+                    child_key = canonical_key(*board_masks(child), perms=perms)[0]
+                    next_frontier.setdefault(child_key, child)
+        if verbose:
+            print("ply {}: {} positions in {:.1f}s".format(ply, len(frontier), time.time() - start))
+        frontier = next_frontier
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, width, height, plies, len(entries)))
+        for key in sorted(entries):
+            f.write(RECORD.pack(key, entries[key]))
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('path')
+    parser.add_argument('--width', type=int, default=7)
+    parser.add_argument('--height', type=int, default=7)
+    parser.add_argument('--plies', type=int, default=3)
+    parser.add_argument('--depth', type=int, default=5)
+    parser.add_argument('--time-limit', type=float, default=None)
+    args = parser.parse_args()
+    build_book(args.path, args.width, args.height, args.plies, args.depth, args.time_limit)
+
+
+if __name__ == "__main__":
+    main()
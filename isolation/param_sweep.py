@@ -0,0 +1,301 @@
+"""Parallel tournament runner for the parameterized score families.
+
+Plays the `*_score_wrap` heuristics from `game_agent` over a grid of
+`(p1, p2)` parameters against the usual CPU agents, spreading matches over a
+process pool. Every match gets a seed derived from the sweep seed and the
+match coordinates, so any row of the results store can be replayed on its
+own, and an interrupted sweep picks up where it stopped.
+
+Example
+-------
+    python param_sweep.py div --p1 0.1 1.5 0.1 --p2 0.1 3.0 0.1 \
+        --opponents AB_Improved MM_Center --matches 20 --out div_sweep.csv
+"""
+import argparse
+import csv
+import decimal
+import itertools
+import json
+import multiprocessing
+import os
+import random
+from collections import OrderedDict, namedtuple
+
+from isolation import Board
+from sample_players import center_score, improved_score, open_move_score
+
+from game_agent import (
+    AlphaBetaPlayer, MinimaxPlayer,
+    center_div_score_wrap, div_score_wrap, minus_score_wrap,
+)
+
+TIME_LIMIT = 150
+
+SCORE_FACTORIES = OrderedDict([
+    ('div', div_score_wrap),
+    ('minus', minus_score_wrap),
+    ('center_div', center_div_score_wrap),
+])
+
+# Same CPU agents as tournament.py; built inside the workers by name so that
+# nothing but plain tuples has to cross the process boundary.
+OPPONENTS = OrderedDict([
+    ('MM_Open', lambda: MinimaxPlayer(score_fn=open_move_score)),
+    ('MM_Center', lambda: MinimaxPlayer(score_fn=center_score)),
+    ('MM_Improved', lambda: MinimaxPlayer(score_fn=improved_score)),
+    ('AB_Open', lambda: AlphaBetaPlayer(score_fn=open_move_score)),
+    ('AB_Center', lambda: AlphaBetaPlayer(score_fn=center_score)),
+    ('AB_Improved', lambda: AlphaBetaPlayer(score_fn=improved_score)),
+])
+
+FIELDS = ['family', 'p1', 'p2', 'opponent', 'match', 'seat', 'seed',
+          'won', 'outcome', 'moves']
+
+Match = namedtuple('Match', ['family', 'params', 'opponent', 'match', 'seed'])
+
+
+def param_grid(p1_values, p2_values):
+    """Cartesian product of the two weight axes as a list of `(p1, p2)`."""
+    return list(itertools.product(p1_values, p2_values))
+
+
+def frange(start, stop, step):
+    """Inclusive float range rounded to the step's precision, so that grid
+    values print the same way as the hand-written ones in `score_params.py`.
+    """
+    digits = max(0, -decimal.Decimal(repr(step)).normalize().as_tuple().exponent)
+    count = int(round((stop - start) / step)) + 1
+    return [round(start + i * step, digits) for i in range(count)]
+
+
+def match_seed(seed, family, params, opponent, match):
+    """Deterministic integer seed for one match of the sweep."""
+    rng = random.Random('{}|{}|{}|{}|{}'.format(seed, family, params, opponent, match))
+    return rng.getrandbits(32)
+
+
+def play_match(match, time_limit=TIME_LIMIT):
+    """Play one match (two games with swapped seats and a shared random
+    opening, as in tournament.py) and return one result row per game.
+
+    The global `random` module is reseeded because `Board.get_legal_moves`
+    shuffles with it; replaying a row with the same seed reproduces the
+    opening and move ordering, although the search depth reached inside the
+    time limit still depends on machine load.
+    """
+    random.seed(match.seed)
+    test_player = AlphaBetaPlayer(score_fn=SCORE_FACTORIES[match.family](match.params))
+    cpu_player = OPPONENTS[match.opponent]()
+
+    games = [Board(test_player, cpu_player), Board(cpu_player, test_player)]
+    for _ in range(2):
+        move = random.choice(games[0].get_legal_moves())
+        for game in games:
+            game.apply_move(move)
+
+    rows = []
+    for seat, game in enumerate(games):
+        winner, history, outcome = game.play(time_limit=time_limit)
+        rows.append(OrderedDict([
+            ('family', match.family),
+            ('p1', match.params[0]),
+            ('p2', match.params[1]),
+            ('opponent', match.opponent),
+            ('match', match.match),
+            ('seat', seat + 1),
+            ('seed', match.seed),
+            ('won', int(winner is test_player)),
+            ('outcome', outcome),
+            ('moves', len(history) + 2),
+        ]))
+    return rows
+
+
+def _play_match(args):
+    return play_match(*args)
+
+
+class ResultStore():
+    """Append-only results file, CSV or JSON lines depending on the extension.
+
+    Rows are flushed as soon as they are written so a killed sweep loses at
+    most the matches that were still in flight.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.is_json = os.path.splitext(path)[1] in ('.json', '.jsonl')
+
+    def rows(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, newline='') as f:
+            if self.is_json:
+                return [json.loads(line) for line in f if line.strip()]
+            rows = []
+            for row in csv.DictReader(f):
+                for key in ('p1', 'p2'):
+                    row[key] = float(row[key])
+                for key in ('match', 'seat', 'seed', 'won', 'moves'):
+                    row[key] = int(row[key])
+                rows.append(row)
+            return rows
+
+    def completed(self):
+        """Keys of the matches for which both games are stored."""
+        seats = {}
+        for row in self.rows():
+            key = (row['family'], (row['p1'], row['p2']), row['opponent'], row['match'])
+            seats.setdefault(key, set()).add(row['seat'])
+        return set(key for key, s in seats.items() if len(s) == 2)
+
+    def open(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, 'a', newline='')
+        if not self.is_json:
+            self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+            if new_file:
+                self._writer.writeheader()
+        return self
+
+    def write(self, rows):
+        for row in rows:
+            if self.is_json:
+                self._file.write(json.dumps(row) + '\n')
+            else:
+                self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def sweep(family, grid, opponents=('AB_Improved',), num_matches=10, out='sweep.csv',
+          seed=0, processes=None, time_limit=TIME_LIMIT, verbose=True):
+    """Play `num_matches` matches of every grid point against every opponent.
+
+    Parameters
+    ----------
+    family : str
+        Key of `SCORE_FACTORIES` (e.g. 'div').
+
+    grid : iterable of (float, float)
+        Parameter pairs passed to the score factory.
+
+    opponents : iterable of str
+        Keys of `OPPONENTS`.
+
+    num_matches : int
+        Matches per (params, opponent); each match is two games.
+
+    out : str
+        Results store path; `.csv` or `.jsonl`. Matches already in the store
+        are skipped, which is how an interrupted sweep is resumed.
+
+    seed : int
+        Sweep seed from which every match seed is derived.
+
+    processes : int (optional)
+        Pool size; defaults to the number of CPUs.
+
+    Returns
+    -------
+    list of dict
+        All rows in the store after the sweep, including resumed ones.
+    """
+    store = ResultStore(out)
+    done = store.completed()
+    matches = []
+    for params in grid:
+        params = tuple(float(p) for p in params)
+        for opponent in opponents:
+            for i in range(num_matches):
+                if (family, params, opponent, i) in done:
+                    continue
+                s = match_seed(seed, family, params, opponent, i)
+                matches.append((Match(family, params, opponent, i, s), time_limit))
+
+    if verbose:
+        print("{} matches to play, {} already stored".format(len(matches), len(done)))
+
+    with store:
+        if processes == 1:
+            for args in matches:
+                store.write(_play_match(args))
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                for rows in pool.imap_unordered(_play_match, matches):
+                    store.write(rows)
+
+    return store.rows()
+
+
+def summarize(rows):
+    """Aggregate result rows into win counts per configuration and opponent.
+
+    Returns
+    -------
+    OrderedDict
+        {(family, p1, p2): {'won': int, 'lost': int, 'timeouts': int,
+        'win_rate': float, 'opponents': {name: (won, lost)}}}, sorted by
+        decreasing win rate.
+    """
+    table = {}
+    for row in rows:
+        key = (row['family'], row['p1'], row['p2'])
+        entry = table.setdefault(key, {'won': 0, 'lost': 0, 'timeouts': 0, 'opponents': {}})
+        won, lost = entry['opponents'].get(row['opponent'], (0, 0))
+        if row['won']:
+            entry['won'] += 1
+            won += 1
+        else:
+            entry['lost'] += 1
+            lost += 1
+            entry['timeouts'] += row['outcome'] == 'timeout'
+        entry['opponents'][row['opponent']] = (won, lost)
+
+    for entry in table.values():
+        entry['win_rate'] = 100. * entry['won'] / (entry['won'] + entry['lost'])
+
+    return OrderedDict(sorted(table.items(), key=lambda kv: -kv[1]['win_rate']))
+
+
+def print_summary(summary, top=None):
+    print("{:<22} {:>8} {:>10}   {}".format("Agent", "Win Rate", "Won | Lost", "per opponent"))
+    for (family, p1, p2), entry in itertools.islice(summary.items(), top):
+        name = "AB_{}_{}/{}".format(family, p1, p2)
+        per_opp = "  ".join("{}: {} | {}".format(opp, w, l)
+                            for opp, (w, l) in sorted(entry['opponents'].items()))
+        print("{:<22} {:>7.1f}% {:>4} | {:<4}  {}".format(
+            name, entry['win_rate'], entry['won'], entry['lost'], per_opp))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('family', choices=list(SCORE_FACTORIES))
+    parser.add_argument('--p1', type=float, nargs=3, metavar=('START', 'STOP', 'STEP'), required=True)
+    parser.add_argument('--p2', type=float, nargs=3, metavar=('START', 'STOP', 'STEP'), required=True)
+    parser.add_argument('--opponents', nargs='+', default=['AB_Improved'], choices=list(OPPONENTS))
+    parser.add_argument('--matches', type=int, default=10)
+    parser.add_argument('--out', default='sweep.csv')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--time-limit', type=int, default=TIME_LIMIT)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    grid = param_grid(frange(*args.p1), frange(*args.p2))
+    rows = sweep(args.family, grid, opponents=args.opponents, num_matches=args.matches,
+                 out=args.out, seed=args.seed, processes=args.processes,
+                 time_limit=args.time_limit)
+    print_summary(summarize(rows), top=args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Adaptive tuning of the `(p1, p2)` weights of the parameterized scores.
+
+Instead of playing the same number of matches for every grid point (see
+`param_sweep.py`), configurations are run through successive halving: every
+survivor gets more matches each round, configurations whose win-rate
+confidence interval lies entirely below the best lower bound are dropped
+right away, and only the top `1 / eta` of the rest move on to the next round.
+
+Matches are the same seeded matches as in `param_sweep`, so the tuner can
+share a results store with a sweep and reuses whatever is already in it.
+
+Example
+-------
+    python param_tuner.py div --p1 0.1 1.5 0.1 --p2 0.1 3.0 0.1 \
+        --opponents AB_Improved MM_Center --out div_tuning.csv
+"""
+import argparse
+import math
+import multiprocessing
+
+from param_sweep import (
+    OPPONENTS, SCORE_FACTORIES, TIME_LIMIT,
+    Match, ResultStore, _play_match, frange, match_seed, param_grid,
+)
+
+
+def wilson_interval(wins, games, z=1.96):
+    """Wilson score interval for a win rate; (0, 1) when nothing was played."""
+    if games == 0:
+        return 0., 1.
+    p = float(wins) / games
+    denom = 1 + z * z / games
+    center = (p + z * z / (2 * games)) / denom
+    half = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denom
+    return center - half, center + half
+
+
+class Arm():
+    """Win/loss record of one parameter configuration."""
+
+    def __init__(self, params):
+        self.params = params
+        self.wins = 0
+        self.games = 0
+
+    @property
+    def win_rate(self):
+        return float(self.wins) / self.games if self.games else 0.
+
+    def interval(self, z=1.96):
+        return wilson_interval(self.wins, self.games, z)
+
+    def __repr__(self):
+        low, high = self.interval()
+        return "{}: {:.1%} [{:.1%}, {:.1%}] over {} games".format(
+            self.params, self.win_rate, low, high, self.games)
+
+
+def successive_halving(family, grid, opponents=('AB_Improved',), min_matches=2, eta=2,
+                       max_matches=64, z=1.96, out='tuning.csv', seed=0, processes=None,
+                       time_limit=TIME_LIMIT, verbose=True):
+    """Find the best `(p1, p2)` for a score family with an adaptive game budget.
+
+    Parameters
+    ----------
+    family : str
+        Key of `param_sweep.SCORE_FACTORIES`.
+
+    grid : iterable of (float, float)
+        Candidate parameter pairs.
+
+    opponents : iterable of str
+        Keys of `param_sweep.OPPONENTS`; every round plays the same number of
+        matches against each of them.
+
+    min_matches : int
+        Matches per opponent for every candidate in the first round.
+
+    eta : int
+        Each round keeps the best `1 / eta` of the candidates and multiplies
+        their match count by `eta`.
+
+    max_matches : int
+        Upper bound on the matches per opponent for a single candidate.
+
+    z : float
+        Normal quantile of the confidence intervals used for early stopping.
+
+    out : str
+        Results store shared with `param_sweep`; already stored matches are
+        reused.
+
+    Returns
+    -------
+    list of Arm
+        The surviving candidates, best first, followed by the eliminated ones
+        in the order they were dropped (most recent first).
+    """
+    if eta < 2:
+        raise ValueError("eta must be at least 2, got {}".format(eta))
+    if not 1 <= min_matches <= max_matches:
+        raise ValueError("Need 1 <= min_matches <= max_matches, got {} and {}".format(
+            min_matches, max_matches))
+    arms = [Arm(tuple(float(p) for p in params)) for params in grid]
+    if not arms:
+        raise ValueError("The parameter grid is empty")
+    alive = list(arms)
+    eliminated = []
+    store = ResultStore(out)
+    pool = multiprocessing.Pool(processes) if processes != 1 else None
+    matches = min_matches
+    total_played = 0
+
+    try:
+        while True:
+            total_played += _play_round(family, alive, opponents, matches, store, seed,
+                                        pool, time_limit)
+            _tally(family, alive, opponents, matches, store)
+
+            best_low = max(arm.interval(z)[0] for arm in alive)
+            losing = [arm for arm in alive if arm.interval(z)[1] < best_low]
+            alive = [arm for arm in alive if arm not in losing]
+            alive.sort(key=lambda arm: -arm.win_rate)
+
+            next_matches = matches * eta
+            if len(alive) > 1 and next_matches <= max_matches:
+                keep = max(1, len(alive) // eta)
+                losing.extend(alive[keep:])
+                alive = alive[:keep]
+            eliminated = losing[::-1] + eliminated
+
+            if verbose:
+                print("{} matches/opponent: {} left, {} dropped, {} games played".format(
+                    matches, len(alive), len(losing), total_played))
+
+            if len(alive) == 1 or next_matches > max_matches:
+                break
+            matches = next_matches
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if verbose:
+        grid_games = len(arms) * len(opponents) * max_matches * 2
+        print("played {} new games; a full sweep at {} matches/opponent is {} games".format(
+            total_played, max_matches, grid_games))
+        for arm in alive:
+            print(arm)
+
+    return alive + eliminated
+
+
+def _play_round(family, arms, opponents, matches, store, seed, pool, time_limit):
+    done = store.completed()
+    jobs = []
+    for arm in arms:
+        for opponent in opponents:
+            for i in range(matches):
+                if (family, arm.params, opponent, i) not in done:
+                    s = match_seed(seed, family, arm.params, opponent, i)
+                    jobs.append((Match(family, arm.params, opponent, i, s), time_limit))
+
+    with store:
+        results = pool.imap_unordered(_play_match, jobs) if pool else map(_play_match, jobs)
+        for rows in results:
+            store.write(rows)
+    return 2 * len(jobs)
+
+
+def _tally(family, arms, opponents, matches, store):
+    # Count only the first `matches` matches per opponent so that rows left
+    # over from a longer sweep do not give some candidates a bigger sample.
+    by_params = dict((arm.params, arm) for arm in arms)
+    opponents = set(opponents)
+    for arm in arms:
+        arm.wins = arm.games = 0
+    for row in store.rows():
+        arm = by_params.get((row['p1'], row['p2']))
+        if (arm is None or row['family'] != family or row['opponent'] not in opponents or
+                row['match'] >= matches):
+            continue
+        arm.wins += row['won']
+        arm.games += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('family', choices=list(SCORE_FACTORIES))
+    parser.add_argument('--p1', type=float, nargs=3, metavar=('START', 'STOP', 'STEP'), required=True)
+    parser.add_argument('--p2', type=float, nargs=3, metavar=('START', 'STOP', 'STEP'), required=True)
+    parser.add_argument('--opponents', nargs='+', default=['AB_Improved'], choices=list(OPPONENTS))
+    parser.add_argument('--min-matches', type=int, default=2)
+    parser.add_argument('--max-matches', type=int, default=64)
+    parser.add_argument('--eta', type=int, default=2)
+    parser.add_argument('--z', type=float, default=1.96)
+    parser.add_argument('--out', default='tuning.csv')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--time-limit', type=int, default=TIME_LIMIT)
+    args = parser.parse_args()
+
+    grid = param_grid(frange(*args.p1), frange(*args.p2))
+    successive_halving(args.family, grid, opponents=args.opponents,
+                       min_matches=args.min_matches, eta=args.eta,
+                       max_matches=args.max_matches, z=args.z, out=args.out,
+                       seed=args.seed, processes=args.processes,
+                       time_limit=args.time_limit)
+
+
+if __name__ == "__main__":
+    main()
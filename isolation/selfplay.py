@@ -0,0 +1,412 @@
+"""Headless self-play between Isolation agents with columnar game records.
+
+Plays every ordered pairing of the chosen agents over a process pool with
+its own game loop (no `tournament.py`), so that besides the result every
+move records the time it took and, for `AlphaBetaPlayer`, the depth reached
+and the nodes searched. Records go to a `GameStore`: a directory holding one
+little-endian binary file per column of a `games` and a `moves` table, which
+NumPy loads without parsing and aggregates with array operations.
+
+Each game is identified by its players, its repetition number within the
+pairing and a seed derived from the run seed and those three, so a stored
+game can be replayed on its own, and a rerun with the same or different
+players or game counts only plays the games the store does not hold yet.
+
+Example
+-------
+    python selfplay.py AB_Custom AB_Improved MCTS --games 20 --out runs/selfplay
+    python selfplay.py --report --out runs/selfplay
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import timeit
+from collections import OrderedDict
+
+import numpy as np
+
+from isolation import Board
+from sample_players import GreedyPlayer, RandomPlayer, center_score, improved_score, open_move_score
+
+from game_agent import (
+    AlphaBetaPlayer, MinimaxPlayer,
+    custom_score, custom_score_2, custom_score_3,
+)
+from mcts import MCTSPlayer
+from minmax_approx import MinMaxApproxPlayer
+
+TIME_LIMIT = 150
+
+# Agents are built inside the workers by name, like the opponents of
+# param_sweep, so only plain tuples cross the process boundary
+PLAYERS = OrderedDict([
+    ('Random', RandomPlayer),
+    ('Greedy', GreedyPlayer),
+    ('MM_Improved', lambda: MinimaxPlayer(score_fn=improved_score)),
+    ('AB_Open', lambda: AlphaBetaPlayer(score_fn=open_move_score)),
+    ('AB_Center', lambda: AlphaBetaPlayer(score_fn=center_score)),
+    ('AB_Improved', lambda: AlphaBetaPlayer(score_fn=improved_score)),
+    ('AB_Custom', lambda: AlphaBetaPlayer(score_fn=custom_score)),
+    ('AB_Custom_2', lambda: AlphaBetaPlayer(score_fn=custom_score_2)),
+    ('AB_Custom_3', lambda: AlphaBetaPlayer(score_fn=custom_score_3)),
+    ('AB_Endgame', lambda: AlphaBetaPlayer(score_fn=custom_score, endgame_budget=50000)),
+    ('MCTS', MCTSPlayer),
+    ('MinMaxApprox', MinMaxApproxPlayer),
+])
+
+OUTCOMES = ['normal', 'timeout', 'forfeit']
+
+# Column name -> little-endian dtype. `winner` is the seat (1 or 2) of the
+# winning player; `time_ms` is NaN for the random opening moves and `depth`
+# is -1 for moves of agents that do not report search statistics.
+GAME_COLUMNS = OrderedDict([
+    ('game', '<u4'),
+    ('player_1', '<u2'),
+    ('player_2', '<u2'),
+    ('repetition', '<u2'),
+    ('winner', '<u1'),
+    ('outcome', '<u1'),
+    ('moves', '<u2'),
+    ('seed', '<u4'),
+])
+
+MOVE_COLUMNS = OrderedDict([
+    ('game', '<u4'),
+    ('ply', '<u2'),
+    ('row', '<i1'),
+    ('col', '<i1'),
+    ('time_ms', '<f4'),
+    ('depth', '<i2'),
+    ('nodes', '<u4'),
+])
+
+
+def game_seed(seed, name_1, name_2, repetition):
+    """Deterministic integer seed for one game of a run."""
+    return random.Random('{}|{}|{}|{}'.format(seed, name_1, name_2, repetition)).getrandbits(32)
+
+
+def schedule(players, games_per_pair, seed=0):
+    """Keys `(player 1, player 2, repetition, seed)` of `games_per_pair`
+    games of every ordered pairing, so each pair meets equally often in both
+    seats.
+    """
+    return [(name_1, name_2, repetition, game_seed(seed, name_1, name_2, repetition))
+            for name_1, name_2 in itertools.permutations(players, 2)
+            for repetition in range(games_per_pair)]
+
+
+def play_game(task, time_limit=TIME_LIMIT, opening_plies=2):
+    """Play one game and return its `games` row and `moves` rows.
+
+    The first `opening_plies` moves are random (from the game seed) so that
+    games between deterministic agents differ. The timing rules follow
+    `Board.play`: a move returned after the time limit loses by timeout, an
+    illegal move while legal moves exist by forfeit.
+    """
+    game_id, name_1, name_2, repetition, seed = task
+    # Board.get_legal_moves shuffles with the global generator
+    random.seed(seed)
+    rng = random.Random(seed)
+    players = [PLAYERS[name_1](), PLAYERS[name_2]()]
+    game = Board(players[0], players[1])
+    moves = []
+
+    for ply in range(opening_plies):
+        move = rng.choice(sorted(game.get_legal_moves()))
+        game.apply_move(move)
+        moves.append((game_id, ply, move[0], move[1], float('nan'), -1, 0))
+
+    outcome = 'normal'
+    while True:
+        player = game.active_player
+        legal_moves = game.get_legal_moves()
+        if not legal_moves:
+            break
+        start = timeit.default_timer()
+        time_left = lambda: time_limit - 1000 * (timeit.default_timer() - start)
+        move = player.get_move(game.copy(), time_left)
+        elapsed = 1000 * (timeit.default_timer() - start)
+
+        stats = getattr(player, 'last_stats', None)
+        depth, nodes = (stats.depth_reached, stats.total_nodes) if stats else (-1, 0)
+        if move is None:
+            move = (-1, -1)
+        moves.append((game_id, len(moves), move[0], move[1], elapsed, depth, nodes))
+
+        if elapsed > time_limit:
+            outcome = 'timeout'
+            break
+        if move not in legal_moves:
+            outcome = 'forfeit'
+            break
+        game.apply_move(move)
+
+    for p in players:
+        if hasattr(p, 'save_stats'):
+            p.save_stats()
+        if hasattr(p, 'close'):
+            p.close()
+    winner = 2 if player is players[0] else 1
+    row = (game_id, name_1, name_2, repetition, winner, outcome, len(moves), seed)
+    return row, moves
+
+
+def _play_game(args):
+    return play_game(*args)
+
+
+class GameStore():
+    """Columnar game records in a directory.
+
+    `meta.json` holds the player names (stored as ids in the `player_*`
+    columns) and the outcome names; every column of the `games` and `moves`
+    tables is a flat binary file (`games.winner.bin`, `moves.nodes.bin`, ...)
+    that is only ever appended to.
+
+    Appends write the moves before the games, so a game counts as stored
+    only once all its rows are. After an interrupted append, columns are
+    read up to the length of the shortest column of their table, moves of
+    games without a games row are ignored, and the next append first
+    truncates the files to those lengths.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {'players': [], 'outcomes': OUTCOMES}
+
+    def player_id(self, name):
+        if name not in self.meta['players']:
+            self.meta['players'].append(name)
+        return self.meta['players'].index(name)
+
+    def _column_path(self, table, column):
+        return os.path.join(self.path, '{}.{}.bin'.format(table, column))
+
+    def append(self, games):
+        """Append `(games row, moves rows)` pairs as returned by `play_game`."""
+        os.makedirs(self.path, exist_ok=True)
+        game_rows, move_rows = [], []
+        for (game, name_1, name_2, repetition, winner, outcome, num_moves, seed), moves in games:
+            game_rows.append((game, self.player_id(name_1), self.player_id(name_2), repetition,
+                              winner, self.meta['outcomes'].index(outcome), num_moves, seed))
+            move_rows.extend(moves)
+        # New player names first, so that every stored id has a name
+        with open(self._meta_path, 'w') as f:
+            json.dump(self.meta, f)
+        for table, columns, rows in (('moves', MOVE_COLUMNS, move_rows),
+                                     ('games', GAME_COLUMNS, game_rows)):
+            self._truncate(table, columns)
+            values = list(zip(*rows)) if rows else [()] * len(columns)
+            for (column, dtype), data in zip(columns.items(), values):
+                with open(self._column_path(table, column), 'ab') as f:
+                    np.asarray(data, dtype=dtype).tofile(f)
+
+    def _rows(self, table, columns):
+        """Number of complete rows of a table: the length of its shortest column."""
+        sizes = []
+        for column, dtype in columns.items():
+            path = self._column_path(table, column)
+            sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize
+                         if os.path.exists(path) else 0)
+        return min(sizes)
+
+    def _truncate(self, table, columns):
+        """Cut the column files of a table back to its complete rows."""
+        rows = self._rows(table, columns)
+        for column, dtype in columns.items():
+            path = self._column_path(table, column)
+            size = rows * np.dtype(dtype).itemsize
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def table(self, name):
+        """Dict of column name -> array for the `games` or `moves` table."""
+        columns = GAME_COLUMNS if name == 'games' else MOVE_COLUMNS
+        rows = self._rows(name, columns)
+        data = OrderedDict()
+        for column, dtype in columns.items():
+            path = self._column_path(name, column)
+            data[column] = np.fromfile(path, dtype=dtype, count=rows) if rows \
+                else np.zeros(0, dtype=dtype)
+        if name == 'moves':
+            keep = np.isin(data['game'], self.table('games')['game'])
+            if not keep.all():
+                data = OrderedDict((column, values[keep]) for column, values in data.items())
+        return data
+
+    def completed(self):
+        """Keys `(player 1, player 2, repetition, seed)` of the stored games."""
+        games = self.table('games')
+        names = self.meta['players']
+        return set((names[p1], names[p2], int(r), int(s)) for p1, p2, r, s in
+                   zip(games['player_1'], games['player_2'], games['repetition'], games['seed']))
+
+    def next_game_id(self):
+        """Smallest game id above those already used, including the ids of
+        moves left by an interrupted append.
+        """
+        rows = self._rows('moves', MOVE_COLUMNS)
+        moves = np.fromfile(self._column_path('moves', 'game'), dtype=MOVE_COLUMNS['game'],
+                            count=rows) if rows else np.zeros(0, dtype=int)
+        ids = np.concatenate([self.table('games')['game'], moves])
+        return int(ids.max()) + 1 if len(ids) else 0
+
+    def win_rates(self):
+        """Wins and games of every player, overall and per opponent.
+
+        Returns
+        -------
+        OrderedDict
+            {name: {'won': int, 'played': int, 'win_rate': float,
+            'opponents': {name: (won, played)}}}, sorted by decreasing win
+            rate.
+        """
+        games = self.table('games')
+        names = self.meta['players']
+        n = len(names)
+        winner = np.where(games['winner'] == 1, games['player_1'], games['player_2'])
+        loser = np.where(games['winner'] == 1, games['player_2'], games['player_1'])
+        # wins[i, j]: games player i won against player j
+        wins = np.bincount(winner.astype(int) * n + loser, minlength=n * n).reshape(n, n)
+        played = wins + wins.T
+        table = {}
+        for i, name in enumerate(names):
+            total = int(played[i].sum())
+            table[name] = {
+                'won': int(wins[i].sum()),
+                'played': total,
+                'win_rate': 100. * wins[i].sum() / total if total else 0.,
+                'opponents': dict((names[j], (int(wins[i, j]), int(played[i, j])))
+                                  for j in range(n) if played[i, j]),
+            }
+        return OrderedDict(sorted(table.items(), key=lambda kv: -kv[1]['win_rate']))
+
+    def move_stats(self):
+        """Per player: moves made, mean/max time per move, and mean depth and
+        nodes per second over the moves made with a reported search.
+        """
+        games, moves = self.table('games'), self.table('moves')
+        # Games are stored in completion order: map game ids to rows. Player 1
+        # makes the even plies.
+        row = np.zeros(int(games['game'].max()) + 1 if len(games['game']) else 0, dtype=int)
+        row[games['game']] = np.arange(len(games['game']))
+        row = row[moves['game']]
+        mover = np.where(moves['ply'] % 2 == 0, games['player_1'][row], games['player_2'][row])
+        played = ~np.isnan(moves['time_ms'])
+        searched = played & (moves['depth'] >= 0)
+        table = OrderedDict()
+        for i, name in enumerate(self.meta['players']):
+            time_ms = moves['time_ms'][(mover == i) & played]
+            mask = (mover == i) & searched
+            search_ms = moves['time_ms'][mask].sum()
+            table[name] = {
+                'moves': len(time_ms),
+                'mean_time_ms': float(time_ms.mean()) if len(time_ms) else 0.,
+                'max_time_ms': float(time_ms.max()) if len(time_ms) else 0.,
+                'mean_depth': float(moves['depth'][mask].mean()) if mask.any() else float('nan'),
+                'nodes_per_sec': (1000. * moves['nodes'][mask].sum() / search_ms
+                                  if search_ms > 0 else float('nan')),
+            }
+        return table
+
+    def outcomes(self):
+        games = self.table('games')
+        counts = np.bincount(games['outcome'], minlength=len(self.meta['outcomes']))
+        return OrderedDict(zip(self.meta['outcomes'], counts.tolist()))
+
+
+def run(players, games_per_pair=10, out='selfplay', seed=0, processes=None,
+        time_limit=TIME_LIMIT, opening_plies=2, flush_every=20, verbose=True):
+    """Play `games_per_pair` games of every ordered pairing of `players`
+    (keys of `PLAYERS`) and append them to the store at `out`, skipping the
+    games it already holds.
+
+    Returns
+    -------
+    GameStore
+    """
+    store = GameStore(out)
+    done = store.completed()
+    scheduled = schedule(players, games_per_pair, seed)
+    keys = [key for key in scheduled if key not in done]
+    first_id = store.next_game_id()
+    tasks = [((first_id + i,) + key, time_limit, opening_plies) for i, key in enumerate(keys)]
+    if verbose:
+        print("{} games to play, {} already stored".format(len(tasks), len(scheduled) - len(tasks)))
+
+    pending = []
+    if processes == 1:
+        results = map(_play_game, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_play_game, tasks)
+    try:
+        for result in results:
+            pending.append(result)
+            if len(pending) >= flush_every:
+                store.append(pending)
+                pending = []
+    finally:
+        if pending:
+            store.append(pending)
+        if pool is not None:
+            pool.terminate()
+    return store
+
+
+def print_report(store):
+    print("{:<14} {:>8} {:>11}   {}".format("Agent", "Win Rate", "Won | Games", "per opponent"))
+    for name, entry in store.win_rates().items():
+        per_opp = "  ".join("{}: {}/{}".format(opp, w, n)
+                            for opp, (w, n) in sorted(entry['opponents'].items()))
+        print("{:<14} {:>7.1f}% {:>5} | {:<5}  {}".format(
+            name, entry['win_rate'], entry['won'], entry['played'], per_opp))
+    print()
+    print("{:<14} {:>7} {:>9} {:>9} {:>7} {:>11}".format(
+        "Agent", "Moves", "Mean ms", "Max ms", "Depth", "Nodes/s"))
+    for name, entry in store.move_stats().items():
+        print("{:<14} {:>7} {:>9.1f} {:>9.1f} {:>7.2f} {:>11.0f}".format(
+            name, entry['moves'], entry['mean_time_ms'], entry['max_time_ms'],
+            entry['mean_depth'], entry['nodes_per_sec']))
+    print()
+    print("Outcomes: " + ", ".join("{} {}".format(k, v) for k, v in store.outcomes().items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('players', nargs='*', metavar='PLAYER',
+                        help="agents to play: " + ", ".join(PLAYERS))
+    parser.add_argument('--games', type=int, default=10, help="games per ordered pairing")
+    parser.add_argument('--out', default='selfplay')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--time-limit', type=int, default=TIME_LIMIT)
+    parser.add_argument('--opening-plies', type=int, default=2)
+    parser.add_argument('--report', action='store_true', help="only print the stored results")
+    args = parser.parse_args()
+
+    if args.report:
+        store = GameStore(args.out)
+    else:
+        if len(args.players) < 2:
+            parser.error("at least two players are needed")
+        unknown = [name for name in args.players if name not in PLAYERS]
+        if unknown:
+            parser.error("unknown players: " + ", ".join(unknown))
+        store = run(args.players, args.games, args.out, args.seed, args.processes,
+                    args.time_limit, args.opening_plies)
+    print_report(store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Board symmetries and symmetry-aware position keys for Isolation.
+
+Knight moves are preserved by the reflections of the board and, on square
+boards, by its rotations, so positions that map onto each other under one of
+these symmetries have the same game-theoretic value. Two kinds of keys are
+provided:
+
+* `canonical_key` packs a position exactly into one int (the smallest image
+  over the symmetry group); it is what the opening book stores.
+* `SymmetryHasher` keeps one Zobrist hash per symmetry and updates all of
+  them with a few XORs per move, so the search can take the minimum as a
+  canonical hash for its transposition table without ever transforming a
+  board.
+"""
+import random
+
+from bitboard import board_masks, iter_bits, to_index
+
+
+def symmetries(width, height):
+    """Cell permutations of the board symmetry group (8 on square boards,
+    4 otherwise); knight moves map onto knight moves under all of them.
+    """
+    maps = [lambda r, c: (r, c),
+            lambda r, c: (height - 1 - r, c),
+            lambda r, c: (r, width - 1 - c),
+            lambda r, c: (height - 1 - r, width - 1 - c)]
+    if width == height:
+        n = width - 1
+        maps += [lambda r, c: (c, r),
+                 lambda r, c: (c, n - r),
+                 lambda r, c: (n - c, r),
+                 lambda r, c: (n - c, n - r)]
+    perms = []
+    for fn in maps:
+        perm = [0] * (width * height)
+        for r in range(height):
+            for c in range(width):
+                perm[r * width + c] = to_index(fn(r, c), width)
+        perms.append(perm)
+    return perms
+
+
+def position_key(blanks, active, inactive, size):
+    """Pack a position into one int: blank mask, then both locations + 1
+    (0 meaning the player has not moved yet) in `size.bit_length()` bits each.
+    """
+    bits = size.bit_length()
+    active = 0 if active is None else active + 1
+    inactive = 0 if inactive is None else inactive + 1
+    return blanks | (active << size) | (inactive << (size + bits))
+
+
+def canonical_key(blanks, active, inactive, perms):
+    """Smallest key over all symmetric images of a position, together with
+    the index of the permutation that produces it.
+    """
+    size = len(perms[0])
+    full = (1 << size) - 1
+    # Transform the blocked cells, which are few in the positions where
+    # exact keys are used (the opening), rather than the blank ones
+    blocked = list(iter_bits(full & ~blanks))
+    best = None
+    for s, perm in enumerate(perms):
+        mask = full
+        for i in blocked:
+            mask ^= 1 << perm[i]
+        key = position_key(mask,
+                           None if active is None else perm[active],
+                           None if inactive is None else perm[inactive],
+                           size)
+        if best is None or key < best[0]:
+            best = (key, s)
+    return best
+
+
+class SymmetryHasher():
+    """Incremental Zobrist hashes of a position under every board symmetry.
+
+    A hash state is `(hashes, active, inactive)`: one hash per symmetry plus
+    the cell indices of the two players, `size` standing for a player who
+    has not moved yet. `child` derives the state after a move from its
+    parent in O(number of symmetries) XORs, and `canonical` is invariant
+    under the symmetry group.
+
+    Parameters
+    ----------
+    width, height : int
+        Board dimensions.
+
+    seed : int
+        Seed of the Zobrist tables.
+    """
+
+    def __init__(self, width, height, seed=0):
+        self.width = width
+        self.height = height
+        self.size = size = width * height
+        perms = symmetries(width, height)
+        rng = random.Random(seed)
+        block = [rng.getrandbits(64) for _ in range(size)]
+        active = [rng.getrandbits(64) for _ in range(size + 1)]
+        inactive = [rng.getrandbits(64) for _ in range(size + 1)]
+        # Per cell, the key of its image under each symmetry; the extra
+        # "not moved" slot is fixed by every symmetry
+        self.block = [tuple(block[p[c]] for p in perms) for c in range(size)]
+        self.active = ([tuple(active[p[c]] for p in perms) for c in range(size)] +
+                       [(active[size],) * len(perms)])
+        self.inactive = ([tuple(inactive[p[c]] for p in perms) for c in range(size)] +
+                         [(inactive[size],) * len(perms)])
+
+    def state(self, game):
+        """Hash state of a board, computed from scratch."""
+        blanks, active, inactive = board_masks(game)
+        active = self.size if active is None else active
+        inactive = self.size if inactive is None else inactive
+        hashes = [a ^ i for a, i in zip(self.active[active], self.inactive[inactive])]
+        for cell in iter_bits(((1 << self.size) - 1) & ~blanks):
+            hashes = [h ^ b for h, b in zip(hashes, self.block[cell])]
+        return tuple(hashes), active, inactive
+
+    def child(self, state, move):
+        """Hash state after the active player moves to `move` (a (row, col)
+        tuple): the target cell gets blocked and the players swap roles.
+        """
+        hashes, active, inactive = state
+        cell = to_index(move, self.width)
+        hashes = tuple(h ^ b ^ a0 ^ i0 ^ a1 ^ i1 for h, b, a0, i0, a1, i1 in zip(
+            hashes, self.block[cell], self.active[active], self.inactive[inactive],
+            self.active[inactive], self.inactive[cell]))
+        return hashes, inactive, cell
+
+    @staticmethod
+    def canonical(state):
+        return min(state[0])
@@ -0,0 +1,320 @@
+"""Planning graphs over an integer-indexed literal and action universe.
+
+`PlanningGraph` builds `PgNode` objects and `expr` comparisons from scratch
+for every state. Here the problem is indexed once by a `ProblemIndex`: fluent
+`i` of `problem.state_map` gives literal id `i` (positive) and `n + i`
+(negative), every ground action and no-op gets an id, and preconditions and
+effects become integer bitmasks. A `BitsetPlanningGraph` for a state then only
+computes what changes between states: the literal and action masks of each
+level, and optionally their mutexes.
+
+Levels follow `PlanningGraph`: an action enters a level when its
+preconditions are all present in the previous literal level (mutexes do not
+prune actions), and the graph stops when two consecutive literal levels hold
+the same literals. `h_levelsum` therefore gives the same values as
+`PlanningGraph.h_levelsum`, with or without mutexes. `h_setlevel` needs the
+mutexes, and a graph built with `stop_at_goals` stops at the set level
+instead.
+"""
+from aimacode.planning import Action
+from aimacode.search import Problem
+from aimacode.utils import expr
+
+
+def iter_bits(mask: int):
+    """Indices of the set bits of `mask`, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class ProblemIndex():
+    """Integer ids and bitmasks for the literals and actions of a problem.
+
+    Actions are `problem.actions_list` followed by a positive and a negative
+    no-op per fluent, in the order used by `PlanningGraph.noop_actions`.
+
+    :param problem: PlanningProblem (e.g. AirCargoProblem) with `state_map`
+        and `actions_list`
+    """
+
+    def __init__(self, problem: Problem):
+        self.problem = problem
+        self.fluents = list(problem.state_map)
+        self.fluent_id = dict((f, i) for i, f in enumerate(self.fluents))
+        n = self.num_fluents = len(self.fluents)
+        self.pos_mask = (1 << n) - 1
+
+        self.actions = list(problem.actions_list)
+        for fluent in self.fluents:
+            self.actions.append(Action(expr("Noop_pos({})".format(fluent)), ([fluent], []), ([fluent], [])))
+            self.actions.append(Action(expr("Noop_neg({})".format(fluent)), ([], [fluent]), ([], [fluent])))
+        self.num_real_actions = len(problem.actions_list)
+
+        self.action_id = dict(((a.name, a.args), i) for i, a in enumerate(self.actions))
+        self.pre = []
+        self.eff = []
+        for action in self.actions:
+            self.pre.append(self.literal_mask(action.precond_pos, action.precond_neg))
+            self.eff.append(self.literal_mask(action.effect_add, action.effect_rem))
+        # Mask over action ids of the real (non no-op) actions
+        self.real_actions = (1 << self.num_real_actions) - 1
+
+        # literal id -> mask of the actions needing / producing it
+        self.needed_by = [0] * (2 * n)
+        self.produced_by = [0] * (2 * n)
+        for a in range(len(self.actions)):
+            for lit in iter_bits(self.pre[a]):
+                self.needed_by[lit] |= 1 << a
+            for lit in iter_bits(self.eff[a]):
+                self.produced_by[lit] |= 1 << a
+        self.pre_ids = [list(iter_bits(pre)) for pre in self.pre]
+
+        # action id -> mask of the actions it is mutex with at every level:
+        # inconsistent effects and interference (the other action produces
+        # or needs the negation of one of our effects, or produces the
+        # negation of one of our preconditions)
+        self.interference = []
+        for a in range(len(self.actions)):
+            m = 0
+            for lit in iter_bits(self.negate(self.eff[a])):
+                m |= self.produced_by[lit] | self.needed_by[lit]
+            for lit in iter_bits(self.negate(self.pre[a])):
+                m |= self.produced_by[lit]
+            self.interference.append(m)
+
+        self.goal = [self.fluent_id[g] for g in problem.goal]
+
+    def literal_mask(self, pos, neg) -> int:
+        """Mask of the literal ids of positive fluents `pos` and negative
+        fluents `neg` (lists of expr).
+        """
+        mask = 0
+        for f in pos:
+            mask |= 1 << self.fluent_id[f]
+        for f in neg:
+            mask |= 1 << (self.num_fluents + self.fluent_id[f])
+        return mask
+
+    def state_literals(self, state: str) -> int:
+        """Literal mask of a T/F state string: every fluent appears exactly
+        once, positive or negative.
+        """
+        n = self.num_fluents
+        mask = 0
+        for i, char in enumerate(state):
+            mask |= 1 << (i if char == 'T' else n + i)
+        return mask
+
+    def literal_id(self, fluent, is_pos: bool) -> int:
+        return self.fluent_id[fluent] + (0 if is_pos else self.num_fluents)
+
+    def negate(self, literals: int) -> int:
+        """Mask of the complements of the literals in `literals`."""
+        n = self.num_fluents
+        return ((literals & self.pos_mask) << n) | (literals >> n)
+
+
+def competing_needs_masks(index: ProblemIndex, s_mutex: dict) -> dict:
+    """Mask of the actions needing a literal mutex with each literal of an
+    S-level.
+
+    :param s_mutex: dict literal id -> mask of mutex literals
+    :return: dict literal id -> mask of actions
+    """
+    needers = {}
+    for lit, rivals in s_mutex.items():
+        m = 0
+        for rival in iter_bits(rivals):
+            m |= index.needed_by[rival]
+        needers[lit] = m
+    return needers
+
+
+def action_mutex_mask(index: ProblemIndex, a: int, actions: int, s_mutex: dict, serial: bool,
+                      competing=None) -> int:
+    """Mask of the actions in `actions` that are mutex with action `a`:
+    serial planning (two non no-ops), inconsistent effects, interference and
+    competing needs.
+
+    :param s_mutex: dict literal id -> mask of mutex literals in the S-level
+        below the actions
+    :param competing: dict (optional) `competing_needs_masks` of `s_mutex`,
+        to share between the actions of a level
+    """
+    m = index.interference[a]
+    if competing is None:
+        rivals = 0
+        for lit in index.pre_ids[a]:
+            rivals |= s_mutex.get(lit, 0)
+        for lit in iter_bits(rivals):
+            m |= index.needed_by[lit]
+    else:
+        for lit in index.pre_ids[a]:
+            m |= competing.get(lit, 0)
+    if serial and a < index.num_real_actions:
+        m |= index.real_actions
+    return m & actions & ~(1 << a)
+
+
+def literal_mutex_masks(index: ProblemIndex, literals: int, actions: int, a_mutex: dict) -> dict:
+    """Mutexes between the literals of an S-level: negation, and
+    inconsistent support (every achiever of one literal in the A-level below
+    is mutex with every achiever of the other).
+
+    :param literals: mask of the literals of the S-level
+    :param actions: mask of the actions of the A-level below
+    :param a_mutex: dict action id -> mask of its mutex actions in that level
+    :return: dict literal id -> mask of mutex literals
+    """
+    lits = list(iter_bits(literals))
+    support = [index.produced_by[lit] & actions for lit in lits]
+    mutex = dict((lit, index.negate(1 << lit) & literals) for lit in lits)
+    for i, lit in enumerate(lits):
+        # Actions mutex with every achiever of `lit`
+        common = actions
+        for a in iter_bits(support[i]):
+            common &= a_mutex[a]
+            if not common:
+                break
+        if not common:
+            continue
+        # The relation is symmetric, so each pair is only tested once
+        for j in range(i + 1, len(lits)):
+            if not support[j] & ~common:
+                mutex[lit] |= 1 << lits[j]
+                mutex[lits[j]] |= 1 << lit
+    return mutex
+
+
+class BitsetPlanningGraph():
+    """Planning graph of one state over a `ProblemIndex`.
+
+    :param index: ProblemIndex of the problem
+    :param state: str (T/F state string)
+    :param serial_planning: bool (whether only one non no-op action can occur
+        at a time)
+    :param mutexes: bool (compute action and literal mutexes; level contents
+        and `h_levelsum` do not depend on them)
+    :param stop_at_goals: bool (stop at the first S-level holding every goal
+        with no two goals mutex; until then, keep going after the literals
+        level off for as long as mutexes still disappear. Implies mutexes)
+    Instance variables calculated:
+        s_levels: list of literal masks, one per S-level
+        a_levels: list of action masks, one per A-level
+        a_mutex: list (per A-level) of dicts action id -> mask of mutex actions
+        s_mutex: list (per S-level) of dicts literal id -> mask of mutex literals
+        goal_level: first S-level holding every goal with no two goals mutex,
+            if reached (only tracked with mutexes)
+    """
+
+    def __init__(self, index: ProblemIndex, state: str, serial_planning=True, mutexes=True,
+                 stop_at_goals=False):
+        self.index = index
+        self.serial = serial_planning
+        self.stop_at_goals = stop_at_goals
+        self.mutexes = mutexes or stop_at_goals
+        self.goal_level = None
+        self.s_levels = [index.state_literals(state)]
+        self.a_levels = []
+        self.a_mutex = []
+        self.s_mutex = [dict((lit, 0) for lit in iter_bits(self.s_levels[0]))] if self.mutexes else []
+        self.create_graph()
+
+    def create_graph(self):
+        index = self.index
+        pre, eff = index.pre, index.eff
+        # Levels only grow, so an action only needs testing until it enters
+        pending = list(range(len(index.actions)))
+        actions = 0
+        if self.mutexes:
+            self.check_goals(0)
+        while not (self.stop_at_goals and self.goal_level is not None):
+            literals = self.s_levels[-1]
+            waiting = []
+            for a in pending:
+                if pre[a] & ~literals:
+                    waiting.append(a)
+                else:
+                    actions |= 1 << a
+            pending = waiting
+            self.a_levels.append(actions)
+
+            effects = 0
+            for a in iter_bits(actions):
+                effects |= eff[a]
+            self.s_levels.append(effects)
+
+            if self.mutexes:
+                self.a_mutex.append(self.action_mutexes(len(self.a_levels) - 1))
+                self.s_mutex.append(self.literal_mutexes(len(self.s_levels) - 1))
+                self.check_goals(len(self.s_levels) - 1)
+
+            if effects == literals:
+                # Mutexes can keep disappearing after the literals level off
+                if not self.stop_at_goals or self.s_mutex[-1] == self.s_mutex[-2]:
+                    break
+
+    def action_mutexes(self, level: int) -> dict:
+        """Mutexes between the actions of A-level `level` (see
+        `action_mutex_mask`).
+        """
+        actions = self.a_levels[level]
+        s_mutex = self.s_mutex[level]
+        competing = competing_needs_masks(self.index, s_mutex)
+        return dict((a, action_mutex_mask(self.index, a, actions, s_mutex, self.serial, competing))
+                    for a in iter_bits(actions))
+
+    def literal_mutexes(self, level: int) -> dict:
+        """Mutexes between the literals of S-level `level` (see
+        `literal_mutex_masks`).
+        """
+        return literal_mutex_masks(self.index, self.s_levels[level], self.a_levels[level - 1],
+                                   self.a_mutex[level - 1])
+
+    def check_goals(self, level: int):
+        """Set `goal_level` if S-level `level` holds every goal with no two
+        goals mutex and no earlier level did.
+        """
+        if self.goal_level is not None:
+            return
+        literals = self.s_levels[level]
+        goals = 0
+        for goal in self.index.goal:
+            goals |= 1 << goal
+        if goals & ~literals:
+            return
+        mutex = self.s_mutex[level]
+        if any(mutex[goal] & goals for goal in self.index.goal):
+            return
+        self.goal_level = level
+
+    def is_mutex_literals(self, level: int, lit1: int, lit2: int) -> bool:
+        return bool(self.s_mutex[level][lit1] >> lit2 & 1)
+
+    def h_levelsum(self) -> int:
+        """The sum of the level costs of the individual goals, with the same
+        -1 contribution as `PlanningGraph.h_levelsum` for an unreachable goal.
+
+        :return: int
+        """
+        level_sum = 0
+        for goal in self.index.goal:
+            goal_level = -1
+            for i, literals in enumerate(self.s_levels):
+                if literals >> goal & 1:
+                    goal_level = i
+                    break
+            level_sum += goal_level
+        return level_sum
+
+    def h_setlevel(self) -> float:
+        """The first level at which every goal is present and no two goals
+        are mutex; float('inf') if the graph never gets there (exact only
+        for graphs built with `stop_at_goals`, which wait for the mutexes to
+        level off).
+        """
+        if not self.mutexes:
+            raise ValueError("h_setlevel needs a graph built with mutexes")
+        return float('inf') if self.goal_level is None else self.goal_level
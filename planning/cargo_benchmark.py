@@ -0,0 +1,140 @@
+"""Scaling benchmark of search configurations on generated air cargo problems.
+
+Every size `CxPxA` (cargos x planes x airports) is instantiated with
+`air_cargo_generated` for a few seeds and solved by each configuration
+(`planning_search` algorithm and heuristic) under a time limit. The table
+reports the averages of expansions, goal tests, new nodes, plan length,
+time, and peak traced memory (`tracemalloc`, which slows searches down but
+counts states, heap entries and heuristic caches alike). Once a
+configuration fails to solve a size in time it is skipped for the larger
+sizes, so the last size it appears with is where it stops scaling.
+
+Example
+-------
+    python cargo_benchmark.py --sizes 2x2x2 3x2x3 4x2x4 5x3x4 --time-limit 30
+"""
+import argparse
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from my_air_cargo_problems import IntStateAirCargoProblem, air_cargo_generated
+from planning_search import best_first_search
+
+# name -> (heuristic method or None, best_first_search keyword arguments)
+CONFIGS = OrderedDict([
+    ('uniform_cost', (None, {})),
+    ('astar_h_1', ('h_1', {})),
+    ('astar_h_ignore_preconditions', ('h_ignore_preconditions', {})),
+    ('astar_h_pg_levelsum', ('h_pg_levelsum', {})),
+    ('astar_h_max', ('h_max', {})),
+    ('astar_h_ff', ('h_ff', {})),
+    ('weighted_astar_h_ff', ('h_ff', {'weight': 2.})),
+    ('greedy_h_ff', ('h_ff', {'greedy': True})),
+])
+
+COLUMNS = ['expansions', 'goal_tests', 'new_nodes', 'plan_length', 'time', 'memory_kb']
+
+
+def parse_size(text: str) -> tuple:
+    """'CxPxA' -> (cargos, planes, airports)"""
+    size = tuple(int(n) for n in text.lower().split('x'))
+    if len(size) != 3 or min(size) < 1:
+        raise ValueError("Size {!r} is not of the form CxPxA".format(text))
+    return size
+
+
+def run_config(problem, config: str, time_limit=None, measure_memory=True) -> OrderedDict:
+    """Solve `problem` with configuration `config` of `CONFIGS`.
+
+    :return: OrderedDict of the search statistics, plus `memory_kb` (peak
+        traced memory, None if not measured)
+    """
+    heuristic, kwargs = CONFIGS[config]
+    # Start every configuration with a cold heuristic cache
+    problem.heuristic_cache.clear()
+    h = None if heuristic is None else getattr(problem, heuristic)
+    if measure_memory:
+        tracemalloc.start()
+    try:
+        result = best_first_search(problem, h, time_limit=time_limit, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1] if measure_memory else None
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+    stats = result.as_dict()
+    stats['memory_kb'] = None if peak is None else peak / 1024.
+    return stats
+
+
+def benchmark(sizes, configs=None, seeds=(0,), time_limit=30., measure_memory=True, report=None):
+    """Run every configuration on every size, smallest first.
+
+    :param sizes: list of (cargos, planes, airports)
+    :param configs: list of `CONFIGS` names (default: all)
+    :param seeds: problem seeds averaged over for each size
+    :param report: callable(size, config, row) called as rows complete
+    :return: list of (size, config, row) where row is an OrderedDict of the
+        `COLUMNS` averages plus `solved` (count of seeds solved), or None
+        when the configuration was skipped after failing a smaller size
+    """
+    configs = list(configs or CONFIGS)
+    failed = set()
+    rows = []
+    for size in sizes:
+        problems = [air_cargo_generated(*size, seed=seed, problem_class=IntStateAirCargoProblem)
+                    for seed in seeds]
+        for config in configs:
+            row = None
+            if config not in failed:
+                runs = [run_config(p, config, time_limit, measure_memory) for p in problems]
+                solved = [r for r in runs if r['status'] == 'solved']
+                row = OrderedDict()
+                for column in COLUMNS:
+                    values = [r[column] for r in runs if r[column] is not None]
+                    row[column] = sum(values) / len(values) if values else None
+                row['solved'] = len(solved)
+                if len(solved) < len(runs):
+                    failed.add(config)
+            rows.append((size, config, row))
+            if report is not None:
+                report(size, config, row)
+    return rows
+
+
+def print_row(size, config, row):
+    label = "{}x{}x{}".format(*size)
+    if row is None:
+        print("{:<8} {:<30} skipped".format(label, config))
+        return
+    memory = '-' if row['memory_kb'] is None else "{:.0f}".format(row['memory_kb'])
+    print("{:<8} {:<30} {:>10.0f} {:>10.0f} {:>10.0f} {:>6} {:>9.3f} {:>10} {:>6}".format(
+        label, config, row['expansions'], row['goal_tests'], row['new_nodes'],
+        '-' if row['plan_length'] is None else "{:.1f}".format(row['plan_length']),
+        row['time'], memory, row['solved']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', nargs='+', default=['2x2x2', '3x2x3', '4x2x4'])
+    parser.add_argument('--configs', nargs='+', default=None)
+    parser.add_argument('--seeds', type=int, default=1, help="problems per size")
+    parser.add_argument('--time-limit', type=float, default=30.)
+    parser.add_argument('--no-memory', action='store_true', help="skip tracemalloc")
+    args = parser.parse_args()
+
+    unknown = [c for c in args.configs or [] if c not in CONFIGS]
+    if unknown:
+        parser.error("unknown configurations {} (choose from {})".format(unknown, list(CONFIGS)))
+
+    print("{:<8} {:<30} {:>10} {:>10} {:>10} {:>6} {:>9} {:>10} {:>6}".format(
+        'size', 'config', 'expansions', 'goal_tests', 'new_nodes', 'plan', 'time', 'memory_kb',
+        'solved'))
+    start = time.time()
+    benchmark([parse_size(s) for s in args.sizes], args.configs, range(args.seeds),
+              args.time_limit, not args.no_memory, print_row)
+    print("total {:.1f}s".format(time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""State-keyed cache for planning heuristics.
+
+`functools.lru_cache` on a heuristic method keys on the `Node` (and the
+problem), so two nodes reaching the same state through different paths
+miss, and the cache keeps nodes and problems alive. `HeuristicCache` keys on
+`(heuristic name, state)` instead, evicts least recently used entries past
+`maxsize`, counts hits and misses, and can be saved to and reloaded from a
+JSON file so that repeated runs on the same problem start warm.
+"""
+import functools
+import json
+import os
+from collections import OrderedDict
+
+
+class HeuristicCache():
+    """Bounded LRU cache of heuristic values keyed by encoded state.
+
+    :param maxsize: int or None (maximum number of entries; None for no
+        limit, 0 disables caching)
+    :param path: str (optional JSON file the cache is loaded from, if it
+        exists, and written to by `save`)
+    :param signature: str (optional problem signature stored with the file;
+        a file saved for another signature is ignored on load)
+    """
+
+    def __init__(self, maxsize=8192, path=None, signature=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.signature = signature
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def lookup(self, name: str, state, compute):
+        """Value of heuristic `name` for `state`, calling `compute()` on a miss
+
+        :param name: str
+        :param state: encoded state (str or int)
+        :param compute: callable with no arguments returning the value
+        :return: the heuristic value
+        """
+        key = (name, state)
+        value = self.entries.get(key)
+        if value is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return value
+        self.misses += 1
+        value = compute()
+        if self.maxsize != 0:
+            self.entries[key] = value
+            if self.maxsize is not None and len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries),
+                'maxsize': self.maxsize, 'hit_rate': float(self.hits) / total if total else 0.}
+
+    def load(self, path: str):
+        """Add the entries of a file written by `save`, unless it was saved
+        for a different problem signature
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('signature') != self.signature:
+            return
+        for name, state, value in data['entries']:
+            self.entries[(name, state)] = value
+        while self.maxsize is not None and len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to save the heuristic cache to")
+        with open(path, 'w') as f:
+            json.dump({'signature': self.signature,
+                       'entries': [[name, state, value] for (name, state), value in self.entries.items()]},
+                      f)
+
+
+def cached_heuristic(method):
+    """Decorator for heuristic methods `h(self, node)` of a problem with a
+    `heuristic_cache` attribute: values are cached by method name and
+    `node.state`
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, node):
+        return self.heuristic_cache.lookup(name, node.state, lambda: method(self, node))
+    return wrapper
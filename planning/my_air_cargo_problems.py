@@ -1,19 +1,26 @@
-from aimacode.logic import PropKB
 from aimacode.planning import Action
 from aimacode.search import (
     Node, Problem,
 )
-from aimacode.utils import expr
+from aimacode.utils import Expr, expr
 from lp_utils import (
     FluentState, encode_state, decode_state,
 )
 from my_planning_graph import PlanningGraph
+from bitset_graph import BitsetPlanningGraph, ProblemIndex
+from heuristic_cache import HeuristicCache, cached_heuristic
+from relaxed_heuristics import RelaxedIndex
 
-from functools import lru_cache
+import hashlib
+import random
+
+TF_TO_BITS = str.maketrans('TF', '10')
+BITS_TO_TF = str.maketrans('10', 'TF')
 
 
 class AirCargoProblem(Problem):
-    def __init__(self, cargos, planes, airports, initial: FluentState, goal: list):
+    def __init__(self, cargos, planes, airports, initial: FluentState, goal: list,
+                 cache_size=8192, cache_path=None):
         """
 
         :param cargos: list of str
@@ -26,6 +33,10 @@ class AirCargoProblem(Problem):
             positive and negative literal fluents (as expr) describing initial state
         :param goal: list of expr
             literal fluents required for goal test
+        :param cache_size: int or None
+            entries of the heuristic cache shared by the h_* methods (None for no limit)
+        :param cache_path: str (optional)
+            JSON file the heuristic cache is loaded from and saved to (see HeuristicCache)
         """
         self.state_map = initial.pos + initial.neg
         self.initial_state_TF = encode_state(initial, self.state_map)
@@ -34,6 +45,35 @@ class AirCargoProblem(Problem):
         self.planes = planes
         self.airports = airports
         self.actions_list = self.get_actions()
+        self._planning_index = None
+        self._relaxed_index = None
+        self.index_actions()
+        self.heuristic_cache = HeuristicCache(cache_size, cache_path, self.signature())
+
+    @property
+    def relaxed_index(self) -> RelaxedIndex:
+        """Precondition/add-effect index for the delete-relaxation heuristics,
+        built on first use.
+        """
+        if self._relaxed_index is None:
+            self._relaxed_index = RelaxedIndex(self.planning_index)
+        return self._relaxed_index
+
+    def signature(self) -> str:
+        """Digest identifying the problem (state encoding, fluents, initial
+        state and goal), under which heuristic values may be reused
+        """
+        text = repr((type(self).__name__, self.state_map, self.initial_state_TF, self.goal))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    @property
+    def planning_index(self) -> ProblemIndex:
+        """Bitset index of the fluents and actions, built on first use and
+        shared by the planning graphs of all states.
+        """
+        if self._planning_index is None:
+            self._planning_index = ProblemIndex(self)
+        return self._planning_index
 
     def get_actions(self):
         """
@@ -54,52 +94,78 @@ class AirCargoProblem(Problem):
         # or 'Load(C2, P2, JFK)'.  The actions for the planning problem must be concrete because the problems in
         # forward search and Planning Graphs must use Propositional Logic
 
+        # Fluents and action names are built as Expr trees directly rather
+        # than by formatting strings for `expr` to parse, and fluents already
+        # in `state_map` are reused, so equal fluents share one object.
+        # Only actions whose preconditions are reachable from the initial
+        # state in the delete relaxation are grounded: the others can never
+        # apply, and skipping them keeps `actions_list` in schema order.
+        symbols = {}
+        fluents = {}
+        for f in self.state_map:
+            key = (f.op,) + tuple(str(arg) for arg in f.args)
+            fluents[key] = f
+            for arg in f.args:
+                symbols.setdefault(str(arg), arg)
+
+        def symbol(name):
+            if name not in symbols:
+                symbols[name] = Expr(name)
+            return symbols[name]
+
+        def fluent(op, *args):
+            key = (op,) + args
+            if key not in fluents:
+                fluents[key] = Expr(op, *[symbol(arg) for arg in args])
+            return fluents[key]
+
+        def action(op, args, precond_pos, effect_add, effect_rem):
+            return Action(Expr(op, *[symbol(arg) for arg in args]),
+                          [precond_pos, []],
+                          [effect_add, effect_rem])
+
+        plane_at, cargo_at, cargo_in = self.relaxed_reachable()
+
         def load_actions():
-            """Create all concrete Load actions and return a list
+            """Create the reachable concrete Load actions and return a list
 
             :return: list of Action objects
             """
             loads = []
             for a in self.airports:
                 for p in self.planes:
+                    if a not in plane_at[p]:
+                        continue
                     for c in self.cargos:
-                        precond_pos = [
-                            expr("At({}, {})".format(c, a)),
-                            expr("At({}, {})".format(p, a))
-                        ]
-                        precond_neg = []
-                        effect_add = [expr("In({}, {})".format(c, p))]
-                        effect_rem = [expr("At({}, {})".format(c, a))]
-                        load = Action(expr("Load({}, {}, {})".format(c, p, a)),
-                                     [precond_pos, precond_neg],
-                                     [effect_add, effect_rem])
-                        loads.append(load)
+                        if a not in cargo_at[c]:
+                            continue
+                        loads.append(action('Load', (c, p, a),
+                                            [fluent('At', c, a), fluent('At', p, a)],
+                                            [fluent('In', c, p)],
+                                            [fluent('At', c, a)]))
             return loads
 
         def unload_actions():
-            """Create all concrete Unload actions and return a list
+            """Create the reachable concrete Unload actions and return a list
 
             :return: list of Action objects
             """
             unloads = []
             for a in self.airports:
                 for p in self.planes:
+                    if a not in plane_at[p]:
+                        continue
                     for c in self.cargos:
-                        precond_pos = [
-                            expr("At({}, {})".format(p, a)),
-                            expr("In({}, {})".format(c, p)),
-                        ]
-                        precond_neg = []
-                        effect_add = [expr("At({}, {})".format(c, a))]
-                        effect_rem = [expr("In({}, {})".format(c, p))]
-                        unload = Action(expr("Unload({}, {}, {})".format(c, p, a)),
-                                     [precond_pos, precond_neg],
-                                     [effect_add, effect_rem])
-                        unloads.append(unload)
+                        if p not in cargo_in[c]:
+                            continue
+                        unloads.append(action('Unload', (c, p, a),
+                                              [fluent('At', p, a), fluent('In', c, p)],
+                                              [fluent('At', c, a)],
+                                              [fluent('In', c, p)]))
             return unloads
 
         def fly_actions():
-            """Create all concrete Fly actions and return a list
+            """Create the reachable concrete Fly actions and return a list
 
             :return: list of Action objects
             """
@@ -108,45 +174,135 @@ class AirCargoProblem(Problem):
                 for to in self.airports:
                     if fr != to:
                         for p in self.planes:
-                            precond_pos = [expr("At({}, {})".format(p, fr)),
-                                           ]
-                            precond_neg = []
-                            effect_add = [expr("At({}, {})".format(p, to))]
-                            effect_rem = [expr("At({}, {})".format(p, fr))]
-                            fly = Action(expr("Fly({}, {}, {})".format(p, fr, to)),
-                                         [precond_pos, precond_neg],
-                                         [effect_add, effect_rem])
-                            flys.append(fly)
+                            if fr not in plane_at[p]:
+                                continue
+                            flys.append(action('Fly', (p, fr, to),
+                                               [fluent('At', p, fr)],
+                                               [fluent('At', p, to)],
+                                               [fluent('At', p, fr)]))
             return flys
 
         return load_actions() + unload_actions() + fly_actions()
 
+    def relaxed_reachable(self):
+        """Where planes and cargos can ever be, ignoring delete effects.
+
+        Planes reach every airport connected to one they start at (all of
+        them, as any plane can fly between any two airports); a cargo can be
+        loaded into every plane that reaches an airport the cargo reaches,
+        and unloaded wherever such a plane goes.
+
+        :return: (dict plane -> set of airports, dict cargo -> set of
+            airports, dict cargo -> set of planes)
+        """
+        plane_at = dict((p, set()) for p in self.planes)
+        cargo_at = dict((c, set()) for c in self.cargos)
+        cargo_in = dict((c, set()) for c in self.cargos)
+        for f, value in zip(self.state_map, self.initial_state_TF):
+            if value != 'T':
+                continue
+            args = [str(arg) for arg in f.args]
+            if f.op == 'At' and args[0] in plane_at:
+                plane_at[args[0]].add(args[1])
+            elif f.op == 'At' and args[0] in cargo_at:
+                cargo_at[args[0]].add(args[1])
+            elif f.op == 'In' and args[0] in cargo_in:
+                cargo_in[args[0]].add(args[1])
+        for p, airports in plane_at.items():
+            if airports:
+                airports.update(self.airports)
+
+        changed = True
+        while changed:
+            changed = False
+            for c in self.cargos:
+                planes = set(p for p in self.planes if plane_at[p] & cargo_at[c]) - cargo_in[c]
+                airports = set()
+                for p in cargo_in[c] | planes:
+                    airports |= plane_at[p]
+                airports -= cargo_at[c]
+                if planes or airports:
+                    cargo_in[c] |= planes
+                    cargo_at[c] |= airports
+                    changed = True
+        return plane_at, cargo_at, cargo_in
+
+    def index_actions(self):
+        """Precompute the bitmask form of `actions_list` used by `actions` and
+        `result`: states are ints with bit i set when fluent `state_map[i]`
+        is true, and every action gets add/remove masks plus the reverse
+        precondition index (fluent -> actions requiring it true/false) as
+        masks over action positions in `actions_list`.
+
+        :return:
+            sets fluent_id, action_id, add_masks, rem_masks, needs_true, needs_false,
+            and goal_mask (the goal fluents, all of which must be true)
+        """
+        self.fluent_id = dict((f, i) for i, f in enumerate(self.state_map))
+        self.action_id = dict((action, i) for i, action in enumerate(self.actions_list))
+        self.add_masks = []
+        self.rem_masks = []
+        self.needs_true = [0] * len(self.state_map)
+        self.needs_false = [0] * len(self.state_map)
+        for i, action in enumerate(self.actions_list):
+            add, rem = self.action_masks(action)
+            self.add_masks.append(add)
+            self.rem_masks.append(rem)
+            for f in action.precond_pos:
+                self.needs_true[self.fluent_id[f]] |= 1 << i
+            for f in action.precond_neg:
+                self.needs_false[self.fluent_id[f]] |= 1 << i
+        self.goal_mask = self.fluent_mask(self.goal)
+
+    def fluent_mask(self, fluents) -> int:
+        mask = 0
+        for f in fluents:
+            mask |= 1 << self.fluent_id[f]
+        return mask
+
+    def action_masks(self, action: Action):
+        """(add mask, remove mask) of an action's effects."""
+        return self.fluent_mask(action.effect_add), self.fluent_mask(action.effect_rem)
+
+    def _bits(self, state: str) -> int:
+        """Bitmask form of a T/F state string (fluent i is bit i)."""
+        return int(state[::-1].translate(TF_TO_BITS), 2) if state else 0
+
+    def _tf(self, bits: int) -> str:
+        """T/F state string of a bitmask state; inverse of `_bits`."""
+        return format(bits, '0{}b'.format(len(self.state_map)))[::-1].translate(BITS_TO_TF)
+
+    def tf_state(self, state) -> str:
+        """The T/F string form of a state of this problem."""
+        return state
+
     def actions(self, state: str) -> list:
         """ Return the actions that can be executed in the given state.
 
+        An action is excluded as soon as one of its preconditions fails, so
+        the applicable actions are those outside the union of
+        `needs_true[f]` over the false fluents and `needs_false[f]` over the
+        true ones; they are returned in `actions_list` order.
+
         :param state: str
             state represented as T/F string of mapped fluents (state variables)
             e.g. 'FTTTFF'
         :return: list of Action objects
         """
+        bits = self._bits(state)
+        blocked = 0
+        for f in range(len(self.state_map)):
+            if bits >> f & 1:
+                blocked |= self.needs_false[f]
+            else:
+                blocked |= self.needs_true[f]
+        applicable = ((1 << len(self.actions_list)) - 1) & ~blocked
 
-        newfs = decode_state(state, self.state_map)
         possible_actions = []
-
-        for action in self.actions_list:
-            ok = True
-            for precond in action.precond_pos:
-                if precond not in newfs.pos:
-                    ok = False
-                    break
-            if ok:
-                for precond in action.precond_neg:
-                    if precond not in newfs.neg:
-                        ok = False
-                        break
-            if ok:
-                possible_actions.append(action)
-
+        while applicable:
+            low = applicable & -applicable
+            possible_actions.append(self.actions_list[low.bit_length() - 1])
+            applicable ^= low
         return possible_actions
 
     def result(self, state: str, action: Action):
@@ -158,23 +314,12 @@ class AirCargoProblem(Problem):
         :param action: Action applied
         :return: resulting state after action
         """
-        newfs = decode_state(state, self.state_map)
-        pos = []
-        neg = []
-
-        for a in newfs.pos:
-            if a in action.effect_rem:
-                neg.append(a)
-            else:
-                pos.append(a)
-        for a in newfs.neg:
-            if a in action.effect_add:
-                pos.append(a)
-            else:
-                neg.append(a)
-
-        new_state = FluentState(pos, neg)
-        return encode_state(new_state, self.state_map)
+        i = self.action_id.get(action)
+        if i is None:
+            add, rem = self.action_masks(action)
+        else:
+            add, rem = self.add_masks[i], self.rem_masks[i]
+        return self._tf((self._bits(state) & ~rem) | add)
 
     def goal_test(self, state: str) -> bool:
         """ Test the state to see if goal is reached
@@ -182,31 +327,38 @@ class AirCargoProblem(Problem):
         :param state: str representing state
         :return: bool
         """
-        kb = PropKB()
-        kb.tell(decode_state(state, self.state_map).pos_sentence())
-        for clause in self.goal:
-            if clause not in kb.clauses:
-                return False
-        return True
+        return self._bits(state) & self.goal_mask == self.goal_mask
 
     def h_1(self, node: Node):
         # note that this is not a true heuristic
         h_const = 1
         return h_const
 
-    @lru_cache(maxsize=8192)
+    @cached_heuristic
     def h_pg_levelsum(self, node: Node):
         """This heuristic uses a planning graph representation of the problem
         state space to estimate the sum of all actions that must be carried
         out from the current state in order to satisfy each individual goal
         condition.
+
+        The graph is a `BitsetPlanningGraph` over `planning_index`, so only the
+        level masks are computed per state; mutexes are skipped because the
+        level costs do not depend on them (see `bitset_graph`).
         """
-        # requires implemented PlanningGraph class
-        pg = PlanningGraph(self, node.state)
+        pg = BitsetPlanningGraph(self.planning_index, self.tf_state(node.state), mutexes=False)
         pg_levelsum = pg.h_levelsum()
         return pg_levelsum
 
-    @lru_cache(maxsize=8192)
+    @cached_heuristic
+    def h_pg_setlevel(self, node: Node):
+        """The first planning graph level at which all goal conditions hold
+        with no two of them mutex. The graph is a `BitsetPlanningGraph` with
+        mutexes, built only up to that level.
+        """
+        pg = BitsetPlanningGraph(self.planning_index, self.tf_state(node.state), stop_at_goals=True)
+        return pg.h_setlevel()
+
+    @cached_heuristic
     def h_ignore_preconditions(self, node: Node):
         """This heuristic estimates the minimum number of actions that must be
         carried out from the current state in order to satisfy all of the goal
@@ -214,15 +366,76 @@ class AirCargoProblem(Problem):
         executed.
         """
         # TODO implement (see Russell-Norvig Ed-3 10.2.3  or Russell-Norvig Ed-2 11.2)
-        count = 0
-        newfs = decode_state(node.state, self.state_map)
-
         # We just count how many goal conditions are false, ignoring the preconditions
-        for a in self.goal:
-            if a in newfs.neg:
-                count = count + 1
+        count = bin(self.goal_mask & ~self._bits(node.state)).count('1')
         return count
 
+    @cached_heuristic
+    def h_max(self, node: Node):
+        """Delete-relaxation cost of the most expensive goal (admissible).
+        """
+        return self.relaxed_index.h_max(self._bits(node.state))
+
+    @cached_heuristic
+    def h_add(self, node: Node):
+        """Sum of the delete-relaxation costs of the goals (not admissible,
+        but more informative than h_max).
+        """
+        return self.relaxed_index.h_add(self._bits(node.state))
+
+    @cached_heuristic
+    def h_ff(self, node: Node):
+        """Number of actions of the FF relaxed plan (not admissible).
+        """
+        return self.relaxed_index.h_ff(self._bits(node.state))
+
+    def helpful_actions(self, state) -> list:
+        """FF helpful actions: the applicable actions achieving a subgoal of
+        the relaxed plan from `state`, in `actions_list` order.
+
+        :return: list of Action objects
+        """
+        return [self.actions_list[a] for a in self.relaxed_index.helpful_actions(self._bits(state))]
+
+
+class IntStateAirCargoProblem(AirCargoProblem):
+    """AirCargoProblem whose states are ints instead of T/F strings.
+
+    Bit i of a state is set when fluent `state_map[i]` is true, which is the
+    form `actions`, `result` and `goal_test` already work on internally, so
+    states go through search frontiers and explored sets as small ints with
+    no conversion. `tf_state` and `int_state` convert losslessly to and from
+    the string encoding of `AirCargoProblem`.
+    """
+
+    def __init__(self, cargos, planes, airports, initial: FluentState, goal: list,
+                 cache_size=8192, cache_path=None):
+        AirCargoProblem.__init__(self, cargos, planes, airports, initial, goal, cache_size, cache_path)
+        self.initial = self.int_state(self.initial_state_TF)
+
+    @classmethod
+    def from_problem(cls, problem: AirCargoProblem):
+        """Int-state version of an AirCargoProblem, with the same heuristic
+        cache size and file (entries are keyed by the int states, under this
+        class's own signature)
+        """
+        cache = problem.heuristic_cache
+        return cls(problem.cargos, problem.planes, problem.airports,
+                   decode_state(problem.initial_state_TF, problem.state_map), problem.goal,
+                   cache.maxsize, cache.path)
+
+    def _bits(self, state: int) -> int:
+        return state
+
+    def _tf(self, bits: int) -> int:
+        return bits
+
+    def tf_state(self, state: int) -> str:
+        return AirCargoProblem._tf(self, state)
+
+    def int_state(self, state: str) -> int:
+        return AirCargoProblem._bits(self, state)
+
 
 def air_cargo_p1() -> AirCargoProblem:
     cargos = ['C1', 'C2']
@@ -335,3 +548,50 @@ def air_cargo_p3() -> AirCargoProblem:
             expr('At(C4, SFO)'),
             ]
     return AirCargoProblem(cargos, planes, airports, init, goal)
+
+
+def air_cargo_generated(num_cargos: int, num_planes: int, num_airports: int, cargo_at=None,
+                        plane_at=None, goal=None, seed=None, problem_class=AirCargoProblem):
+    """Air cargo problem of any size, in the form of `air_cargo_p1`-`p3`.
+
+    Objects are named C1.., P1.. and A1... Cargos and planes start at the
+    airports given in `cargo_at` and `plane_at` (dicts name -> airport) or
+    at random ones, and the goal (dict cargo -> airport) defaults to every
+    cargo at a random airport other than its start. The initial FluentState
+    lists every ground fluent, true or false, as the hand-written problems
+    do.
+
+    :param seed: int (seed of the random placements and goals)
+    :param problem_class: AirCargoProblem or a subclass such as
+        IntStateAirCargoProblem
+    :return: problem_class instance
+    """
+    rng = random.Random(seed)
+    cargos = ['C{}'.format(i + 1) for i in range(num_cargos)]
+    planes = ['P{}'.format(i + 1) for i in range(num_planes)]
+    airports = ['A{}'.format(i + 1) for i in range(num_airports)]
+    cargo_at = dict(cargo_at or {})
+    for c in cargos:
+        cargo_at.setdefault(c, rng.choice(airports))
+    plane_at = dict(plane_at or {})
+    for p in planes:
+        plane_at.setdefault(p, rng.choice(airports))
+    if goal is None:
+        goal = {}
+        for c in cargos:
+            others = [a for a in airports if a != cargo_at[c]]
+            goal[c] = rng.choice(others or airports)
+
+    pos = []
+    neg = []
+    for c in cargos:
+        for a in airports:
+            (pos if cargo_at[c] == a else neg).append(expr('At({}, {})'.format(c, a)))
+        for p in planes:
+            neg.append(expr('In({}, {})'.format(c, p)))
+    for p in planes:
+        for a in airports:
+            (pos if plane_at[p] == a else neg).append(expr('At({}, {})'.format(p, a)))
+    init = FluentState(pos, neg)
+    goal = [expr('At({}, {})'.format(c, goal[c])) for c in cargos if c in goal]
+    return problem_class(cargos, planes, airports, init, goal)
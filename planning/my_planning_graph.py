@@ -1,7 +1,10 @@
+import weakref
+
 from aimacode.planning import Action
 from aimacode.search import Problem
 from aimacode.utils import expr
-from lp_utils import ( decode_state, encode_state, FluentState )
+from lp_utils import decode_state
+from bitset_graph import ProblemIndex, action_mutex_mask, iter_bits, literal_mutex_masks
 
 
 class PgNode():
@@ -13,6 +16,8 @@ class PgNode():
     mutex: the set of sibling nodes that are mutually exclusive with this node
     """
 
+    __slots__ = ('parents', 'children', 'mutex')
+
     def __init__(self):
         self.parents = set()
         self.children = set()
@@ -56,6 +61,8 @@ class PgNode_s(PgNode):
         negative.
     """
 
+    __slots__ = ('symbol', 'is_pos', '__hash')
+
     def __init__(self, symbol: str, is_pos: bool):
         """S-level Planning Graph node constructor
 
@@ -74,6 +81,18 @@ class PgNode_s(PgNode):
         self.is_pos = is_pos
         self.__hash = None
 
+    def copy(self):
+        """Unlinked node for the same literal, reusing the computed hash
+
+        :return: PgNode_s
+        """
+        node = PgNode_s.__new__(PgNode_s)
+        PgNode.__init__(node)
+        node.symbol = self.symbol
+        node.is_pos = self.is_pos
+        node.__hash = hash(self)
+        return node
+
     def show(self):
         """helper print for debugging shows literal plus counts of parents,
         children, siblings
@@ -105,6 +124,7 @@ class PgNode_s(PgNode):
 class PgNode_a(PgNode):
     """A-type (action) Planning Graph node - inherited from PgNode """
 
+    __slots__ = ('action', 'prenodes', 'effnodes', 'is_persistent', '__hash')
 
     def __init__(self, action: Action):
         """A-level Planning Graph node constructor
@@ -139,6 +159,21 @@ class PgNode_a(PgNode):
         print("\n*** {!s}".format(self.action))
         PgNode.show(self)
 
+    def copy(self):
+        """Unlinked node for the same action, sharing the (read-only) prenodes
+        and effnodes sets and reusing the computed hash
+
+        :return: PgNode_a
+        """
+        node = PgNode_a.__new__(PgNode_a)
+        PgNode.__init__(node)
+        node.action = self.action
+        node.prenodes = self.prenodes
+        node.effnodes = self.effnodes
+        node.is_persistent = self.is_persistent
+        node.__hash = hash(self)
+        return node
+
     def precond_s_nodes(self):
         """precondition literals as S-nodes (represents possible parents for this node).
         It is computationally expensive to call this function; it is only called by the
@@ -183,6 +218,63 @@ class PgNode_a(PgNode):
         return self.__hash
 
 
+class PgNodeFactory():
+    """Static planning graph structure of a problem, shared by the graphs of
+    all its states
+
+    Holds the problem's `ProblemIndex` (whose no-op actions it reuses) and a
+    template node per action and per literal, with precondition/effect node
+    sets and hashes computed once. Graph nodes
+    are still created per level, since their parents, children and mutex
+    links belong to one level of one graph, but they are copied from the
+    templates instead of being built from expr objects.
+
+    :param problem: PlanningProblem with `state_map` and `actions_list`
+    """
+
+    def __init__(self, problem: Problem):
+        self.index = getattr(problem, 'planning_index', None) or ProblemIndex(problem)
+        self.noops = self.index.actions[self.index.num_real_actions:]
+        self.all_actions = problem.actions_list + self.noops
+        self.literals = [(self.template(PgNode_s(f, False)), self.template(PgNode_s(f, True)))
+                         for f in problem.state_map]
+        self.action_nodes = {}
+        for action in self.all_actions:
+            anode = self.template(PgNode_a(action))
+            anode.prenodes = frozenset(self.template(n) for n in anode.prenodes)
+            anode.effnodes = frozenset(self.template(n) for n in anode.effnodes)
+            self.action_nodes[action] = anode
+
+    @staticmethod
+    def template(node: PgNode) -> PgNode:
+        hash(node)
+        return node
+
+    def state_nodes(self, state: str) -> set:
+        """Unlinked S-nodes of the literals of a T/F state string
+
+        :return: set of PgNode_s
+        """
+        return set(self.literals[i][char == 'T'].copy() for i, char in enumerate(state))
+
+    def action_node(self, action: Action) -> PgNode_a:
+        """Unlinked A-node of an action"""
+        return self.action_nodes[action].copy()
+
+
+_factories = weakref.WeakKeyDictionary()
+
+
+def node_factory(problem: Problem) -> PgNodeFactory:
+    """The PgNodeFactory (and with it the ProblemIndex) of a problem,
+    created on first use and dropped together with the problem
+    """
+    factory = _factories.get(problem)
+    if factory is None:
+        factory = _factories[problem] = PgNodeFactory(problem)
+    return factory
+
+
 def mutexify(node1: PgNode, node2: PgNode):
     """ adds sibling nodes to each other's mutual exclusion (mutex) set. These should be sibling nodes!
 
@@ -203,24 +295,39 @@ class PlanningGraph():
     graph can be used to reason about
     """
 
-    def __init__(self, problem: Problem, state: str, serial_planning=True):
+    def __init__(self, problem: Problem, state: str, serial_planning=True, stop_at_goals=False):
         """
         :param problem: PlanningProblem (or subclass such as AirCargoProblem or HaveCakeProblem)
         :param state: str (will be in form TFTTFF... representing fluent states)
         :param serial_planning: bool (whether or not to assume that only one action can occur at a time)
+        :param stop_at_goals: bool (stop expanding at the first S-level holding every goal with no two
+            goals mutex; until then, keep expanding after the literals level off for as long as
+            mutexes still disappear. Without it the graph stops when the literals level off)
         Instance variable calculated:
             fs: FluentState
                 the state represented as positive and negative fluent literal lists
             all_actions: list of the PlanningProblem valid ground actions combined with calculated no-op actions
             s_levels: list of sets of PgNode_s, where each set in the list represents an S-level in the planning graph
             a_levels: list of sets of PgNode_a, where each set in the list represents an A-level in the planning graph
+            index: ProblemIndex giving the integer literal and action ids used for mutex computation
+            literal_level: dict literal id -> first S-level containing the literal
+            goal_pair_level: dict (goal id, goal id) -> first S-level containing both goals, not mutex
+            goal_level: first S-level containing every goal with no two goals mutex (None if never)
         """
         self.problem = problem
+        self.factory = node_factory(problem)
+        self.index = self.factory.index
+        self.state = state
         self.fs = decode_state(state, problem.state_map)
         self.serial = serial_planning
-        self.all_actions = self.problem.actions_list + self.noop_actions(self.problem.state_map)
+        self.stop_at_goals = stop_at_goals
+        self.all_actions = self.factory.all_actions
         self.s_levels = []
         self.a_levels = []
+        self.goals = [self.index.literal_id(g, True) for g in problem.goal]
+        self.literal_level = {}
+        self.goal_pair_level = {}
+        self.goal_level = None
         self.create_graph()
 
     def noop_actions(self, literal_list):
@@ -273,26 +380,61 @@ class PlanningGraph():
         # initialize S0 to literals in initial state provided.
         leveled = False
         level = 0
-        self.s_levels.append(set())  # S0 set of s_nodes - empty to start
-        # for each fluent in the initial state, add the correct literal PgNode_s
-        for literal in self.fs.pos:
-            self.s_levels[level].add(PgNode_s(literal, True))
-        for literal in self.fs.neg:
-            self.s_levels[level].add(PgNode_s(literal, False))
+        # S0 set of s_nodes: the correct literal PgNode_s for each fluent in the initial state
+        self.s_levels.append(self.factory.state_nodes(self.state))
         # no mutexes at the first level
+        self.record_levels(level)
 
         # continue to build the graph alternating A, S levels until last two S levels contain the same literals,
-        # i.e. until it is "leveled"
-        while not leveled:
+        # i.e. until it is "leveled", or until the goals are reached if stop_at_goals is set
+        while not leveled and not (self.stop_at_goals and self.goal_level is not None):
             self.add_action_level(level)
             self.update_a_mutex(self.a_levels[level])
 
             level += 1
             self.add_literal_level(level)
             self.update_s_mutex(self.s_levels[level])
+            self.record_levels(level)
 
             if self.s_levels[level] == self.s_levels[level - 1]:
-                leveled = True
+                # Mutexes can keep disappearing after the literals level off; a graph built for
+                # h_setlevel also waits for them to level off, so that the value is exact
+                leveled = (not self.stop_at_goals or
+                           self.mutex_count(level) == self.mutex_count(level - 1))
+
+    def mutex_count(self, level) -> int:
+        return sum(len(n.mutex) for n in self.s_levels[level])
+
+    def record_levels(self, level):
+        """Record the literals and goal pairs first reached at S-level `level`
+
+        Levels only grow and mutexes only disappear from one S-level to the next, so the first level
+        at which a literal appears, or a pair of goals appears without being mutex, stays valid for
+        all later levels.
+
+        :param level: int (an S-level whose mutexes are up to date)
+        :return:
+            updates literal_level, goal_pair_level and goal_level
+        """
+        nodes = dict((self.index.literal_id(n.symbol, n.is_pos), n) for n in self.s_levels[level])
+        for lit in nodes:
+            self.literal_level.setdefault(lit, level)
+        if self.goal_level is not None:
+            return
+        reached = True
+        for i, g1 in enumerate(self.goals):
+            if g1 not in nodes:
+                reached = False
+                continue
+            for g2 in self.goals[i + 1:]:
+                if (g1, g2) in self.goal_pair_level:
+                    continue
+                if g2 in nodes and not nodes[g1].is_mutex(nodes[g2]):
+                    self.goal_pair_level[(g1, g2)] = level
+                else:
+                    reached = False
+        if reached:
+            self.goal_level = level
 
     def add_action_level(self, level):
         """ add an A (action) level to the Planning Graph
@@ -314,13 +456,17 @@ class PlanningGraph():
         #print('add_action_level', level)
         self.a_levels.append(set())
 
+        s_level = self.s_levels[level]
+        # the level's own node for each literal, to link to
+        s_nodes = dict((snode, snode) for snode in s_level)
         for a in self.all_actions:
-            anode = PgNode_a(a)
-            if anode.prenodes.issubset(self.s_levels[level]):
-                for snode in self.s_levels[level]:
-                    if snode in anode.prenodes:
-                        anode.parents.add(snode)
-                        snode.children.add(anode)
+            template = self.factory.action_nodes[a]
+            if template.prenodes.issubset(s_level):
+                anode = template.copy()
+                for pre in template.prenodes:
+                    snode = s_nodes[pre]
+                    anode.parents.add(snode)
+                    snode.children.add(anode)
                 self.a_levels[level].add(anode)
 
     def add_literal_level(self, level):
@@ -343,14 +489,16 @@ class PlanningGraph():
 
         #print('add_literal_level', level)
 
-        self.s_levels.append(set())
-
+        # one node per literal, linked to every action producing it
+        nodes = {}
         for anode in self.a_levels[level-1]:
             for eff in anode.effnodes:
-                node = PgNode_s(eff.symbol, eff.is_pos)
+                node = nodes.get(eff)
+                if node is None:
+                    node = nodes[eff] = eff.copy()
                 node.parents.add(anode)
                 anode.children.add(node)
-                self.s_levels[level].add(node)
+        self.s_levels.append(set(nodes.values()))
 
     def update_a_mutex(self, nodeset):
         """ Determine and update sibling mutual exclusion for A-level nodes
@@ -363,19 +511,37 @@ class PlanningGraph():
            Interference
            Competing needs
 
+        The pairwise tests below are evaluated for all pairs at once with the
+        integer bitmasks of `self.index` (see `bitset_graph.action_mutex_mask`).
+
         :param nodeset: set of PgNode_a (siblings in the same level)
         :return:
             mutex set in each PgNode_a in the set is appropriately updated
         """
-        nodelist = list(nodeset)
-        for i, n1 in enumerate(nodelist[:-1]):
-            for n2 in nodelist[i + 1:]:
-                if (self.serialize_actions(n1, n2) or
-                        self.inconsistent_effects_mutex(n1, n2) or
-                        self.interference_mutex(n1, n2) or
-                        self.competing_needs_mutex(n1, n2)):
-                    #print('mutexify ({}, {}) and ({}, {})'.format(n1.action.name, n1.action.args, n2.action.name, n2.action.args))
-                    mutexify(n1, n2)
+        index = self.index
+        nodes = dict((index.action_id[(n.action.name, n.action.args)], n) for n in nodeset)
+        actions = 0
+        for a in nodes:
+            actions |= 1 << a
+        # literal mutexes of the parent S-level as masks
+        s_mutex = {}
+        for n in nodeset:
+            for snode in n.parents:
+                lit = index.literal_id(snode.symbol, snode.is_pos)
+                if lit not in s_mutex:
+                    s_mutex[lit] = self.literal_ids(snode.mutex)
+        for a, n1 in nodes.items():
+            # only pairs with a higher id: mutexify marks both nodes
+            others = action_mutex_mask(index, a, actions, s_mutex, self.serial) >> (a + 1)
+            for b in iter_bits(others):
+                mutexify(n1, nodes[a + 1 + b])
+
+    def literal_ids(self, snodes) -> int:
+        """Mask of the literal ids of a collection of PgNode_s."""
+        mask = 0
+        for snode in snodes:
+            mask |= 1 << self.index.literal_id(snode.symbol, snode.is_pos)
+        return mask
 
     def serialize_actions(self, node_a1: PgNode_a, node_a2: PgNode_a) -> bool:
         """
@@ -472,15 +638,31 @@ class PlanningGraph():
            Negation
            Inconsistent support
 
-        :param nodeset: set of PgNode_a (siblings in the same level)
+        As for actions, all pairs are tested at once on bitmasks (see
+        `bitset_graph.literal_mutex_masks`).
+
+        :param nodeset: set of PgNode_s (siblings in the same level)
         :return:
-            mutex set in each PgNode_a in the set is appropriately updated
+            mutex set in each PgNode_s in the set is appropriately updated
         """
-        nodelist = list(nodeset)
-        for i, n1 in enumerate(nodelist[:-1]):
-            for n2 in nodelist[i + 1:]:
-                if self.negation_mutex(n1, n2) or self.inconsistent_support_mutex(n1, n2):
-                    mutexify(n1, n2)
+        index = self.index
+        nodes = dict((index.literal_id(n.symbol, n.is_pos), n) for n in nodeset)
+        literals = 0
+        for lit in nodes:
+            literals |= 1 << lit
+        # achievers come from the A-level below, with its mutexes as masks
+        anodes = self.a_levels[-1] if self.a_levels else set()
+        actions = 0
+        a_mutex = {}
+        for n in anodes:
+            a = index.action_id[(n.action.name, n.action.args)]
+            actions |= 1 << a
+            a_mutex[a] = 0
+            for other in n.mutex:
+                a_mutex[a] |= 1 << index.action_id[(other.action.name, other.action.args)]
+        for lit, mask in literal_mutex_masks(index, literals, actions, a_mutex).items():
+            for other in iter_bits(mask >> (lit + 1)):
+                mutexify(nodes[lit], nodes[lit + 1 + other])
 
     def negation_mutex(self, node_s1: PgNode_s, node_s2: PgNode_s) -> bool:
         """
@@ -495,7 +677,7 @@ class PlanningGraph():
         :param node_s2: PgNode_s
         :return: bool
         """
-        return  node_s1.is_pos != node_s2.is_pos
+        return node_s1.symbol == node_s2.symbol and node_s1.is_pos != node_s2.is_pos
 
     def inconsistent_support_mutex(self, node_s1: PgNode_s, node_s2: PgNode_s):
         """
@@ -514,41 +696,37 @@ class PlanningGraph():
         :return: bool
         """
 
+        if not node_s1.parents or not node_s2.parents:
+            return False
         for a1 in node_s1.parents:
             for a2 in node_s2.parents:
-                if a1.is_mutex(a2):
-                    mutex = True
-                    for s in a1.children:
-                        if s == node_s2:
-                            mutex = False
-                            break
-                    for s in a2.children:
-                        if s == node_s1:
-                            mutex = False
-                            break
-                    if mutex:
-                        return True
-                    else:
-                        return False
-        return False
+                if a1 is a2 or not a1.is_mutex(a2):
+                    return False
+        return True
 
     def h_levelsum(self) -> int:
         """The sum of the level costs of the individual goals (admissible if goals independent)
 
+        A goal never reached counts as -1.
+
         :return: int
         """
-        level_sum = 0
-
-        # for each goal in the problem, determine the level cost, then add them together
-        for goal in self.problem.goal:
-            goal_level = -1
-            for i, s_level in enumerate(self.s_levels):
-                for s_node in s_level:
-                    if goal == s_node.symbol and s_node.is_pos:
-                        goal_level = i
-                        break
-                if goal_level > -1:
-                    break
-            level_sum = level_sum + goal_level
-
-        return level_sum
+        return sum(self.literal_level.get(g, -1) for g in self.goals)
+
+    def h_maxlevel(self) -> float:
+        """The largest level cost of the individual goals (admissible)
+
+        :return: int (float('inf') if a goal is never reached)
+        """
+        return max([self.literal_level.get(g, float('inf')) for g in self.goals] or [0])
+
+    def h_setlevel(self) -> float:
+        """The first level at which every goal is present and no two goals are mutex (admissible,
+        and at least h_maxlevel)
+
+        Exact for graphs built with stop_at_goals; a graph that stopped when its literals levelled
+        off may miss a set level reached only after more mutexes disappear.
+
+        :return: int (float('inf') if the goals are never reached together)
+        """
+        return float('inf') if self.goal_level is None else self.goal_level
@@ -0,0 +1,210 @@
+"""Best-first search engine for planning problems.
+
+`aimacode.search` wraps every generated state in a `Node` object holding its
+parent, action, depth and path cost, and keeps whole nodes in its frontier.
+This engine keeps only compact states: the open list is a binary heap of
+`(priority, tie-break, counter, state)` tuples, the best known path cost and
+the parent link of each state live in dicts keyed by state, and the closed
+set is a hash set. With the int states of `IntStateAirCargoProblem` every
+entry is a few small ints.
+
+One function covers uniform-cost search (no heuristic), A*, weighted A*
+(`weight` > 1) and greedy best-first search (`greedy=True`). Heuristics are
+the `h_*` methods of `AirCargoProblem`, which only read `node.state`.
+
+Example
+-------
+    python planning_search.py --problem 3 --heuristic h_ff --weight 1.5
+"""
+import argparse
+import heapq
+import time
+from collections import OrderedDict
+
+
+class StateNode():
+    """Minimal stand-in for `aimacode.search.Node` passed to heuristics."""
+
+    __slots__ = ('state',)
+
+    def __init__(self, state):
+        self.state = state
+
+
+class SearchResult():
+    """Plan found by `best_first_search` and the search statistics.
+
+    Counters use the names of `aimacode.search.InstrumentedProblem`:
+    `expansions` (states whose successors were generated), `goal_tests` and
+    `new_nodes` (generated successor states).
+    """
+
+    def __init__(self):
+        self.plan = None
+        self.cost = None
+        self.expansions = 0
+        self.goal_tests = 0
+        self.new_nodes = 0
+        self.max_open = 0
+        self.time = 0.
+        self.status = 'exhausted'
+
+    @property
+    def solved(self) -> bool:
+        return self.plan is not None
+
+    def as_dict(self) -> OrderedDict:
+        return OrderedDict([
+            ('status', self.status),
+            ('plan_length', None if self.plan is None else len(self.plan)),
+            ('cost', self.cost),
+            ('expansions', self.expansions),
+            ('goal_tests', self.goal_tests),
+            ('new_nodes', self.new_nodes),
+            ('max_open', self.max_open),
+            ('time', self.time),
+        ])
+
+
+def best_first_search(problem, h=None, weight=1., greedy=False, tie_break='h',
+                      max_expansions=None, time_limit=None) -> SearchResult:
+    """Best-first graph search over the states of `problem`.
+
+    :param problem: Problem with `initial`, `actions`, `result`, `goal_test`
+        and `path_cost`
+    :param h: callable (heuristic taking a node with a `state` attribute, e.g.
+        `problem.h_ff`); None for uniform-cost search
+    :param weight: float (priority is g + weight * h; 1 gives A*)
+    :param greedy: bool (priority is h alone)
+    :param tie_break: str ('h': lower h first, 'g': higher g first, i.e.
+        deeper nodes; 'fifo': insertion order only)
+    :param max_expansions: int (optional limit; the search stops with status
+        'limit')
+    :param time_limit: float (optional limit in seconds; status 'timeout')
+    :return: SearchResult
+    """
+    result = SearchResult()
+    start = time.time()
+
+    def heuristic(state):
+        return 0 if h is None else h(StateNode(state))
+
+    def entry(g, state):
+        h_value = heuristic(state)
+        if greedy:
+            priority = h_value
+        else:
+            priority = g + weight * h_value
+        if tie_break == 'h':
+            second = h_value
+        elif tie_break == 'g':
+            second = -g
+        else:
+            second = 0
+        return priority, second, h_value
+
+    initial = problem.initial
+    best_g = {initial: 0}
+    parent = {initial: None}
+    closed = set()
+    counter = 0
+    priority, second, h_value = entry(0, initial)
+    open_list = [(priority, second, counter, initial)]
+
+    while open_list:
+        priority, second, _, state = heapq.heappop(open_list)
+        if state in closed:
+            continue
+        g = best_g[state]
+
+        result.goal_tests += 1
+        if problem.goal_test(state):
+            result.plan = _plan(parent, state)
+            result.cost = g
+            result.status = 'solved'
+            break
+
+        if max_expansions is not None and result.expansions >= max_expansions:
+            result.status = 'limit'
+            break
+        if time_limit is not None and time.time() - start > time_limit:
+            result.status = 'timeout'
+            break
+
+        closed.add(state)
+        result.expansions += 1
+        for action in problem.actions(state):
+            child = problem.result(state, action)
+            result.new_nodes += 1
+            if child in closed:
+                continue
+            child_g = problem.path_cost(g, state, action, child)
+            if child_g >= best_g.get(child, float('inf')):
+                continue
+            best_g[child] = child_g
+            parent[child] = (state, action)
+            priority, second, h_value = entry(child_g, child)
+            if h_value == float('inf'):
+                continue
+            counter += 1
+            heapq.heappush(open_list, (priority, second, counter, child))
+        result.max_open = max(result.max_open, len(open_list))
+
+    result.time = time.time() - start
+    return result
+
+
+def _plan(parent, state) -> list:
+    actions = []
+    while parent[state] is not None:
+        state, action = parent[state]
+        actions.append(action)
+    actions.reverse()
+    return actions
+
+
+def uniform_cost(problem, **kwargs) -> SearchResult:
+    return best_first_search(problem, None, **kwargs)
+
+
+def astar(problem, h, **kwargs) -> SearchResult:
+    return best_first_search(problem, h, **kwargs)
+
+
+def weighted_astar(problem, h, weight=1.5, **kwargs) -> SearchResult:
+    return best_first_search(problem, h, weight=weight, **kwargs)
+
+
+def greedy_best_first(problem, h, **kwargs) -> SearchResult:
+    return best_first_search(problem, h, greedy=True, **kwargs)
+
+
+def main():
+    from my_air_cargo_problems import (
+        IntStateAirCargoProblem, air_cargo_p1, air_cargo_p2, air_cargo_p3,
+    )
+
+    problems = {1: air_cargo_p1, 2: air_cargo_p2, 3: air_cargo_p3}
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--problem', type=int, choices=sorted(problems), default=1)
+    parser.add_argument('--heuristic', default='h_ff',
+                        help="AirCargoProblem heuristic method, or 'none' for uniform-cost search")
+    parser.add_argument('--weight', type=float, default=1.)
+    parser.add_argument('--greedy', action='store_true')
+    parser.add_argument('--tie-break', choices=['h', 'g', 'fifo'], default='h')
+    parser.add_argument('--time-limit', type=float, default=None)
+    args = parser.parse_args()
+
+    problem = IntStateAirCargoProblem.from_problem(problems[args.problem]())
+    h = None if args.heuristic == 'none' else getattr(problem, args.heuristic)
+    result = best_first_search(problem, h, weight=args.weight, greedy=args.greedy,
+                               tie_break=args.tie_break, time_limit=args.time_limit)
+    for key, value in result.as_dict().items():
+        print("{:<12} {}".format(key, value))
+    if result.solved:
+        for action in result.plan:
+            print("  {}{}".format(action.name, action.args))
+
+
+if __name__ == "__main__":
+    main()
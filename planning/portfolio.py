@@ -0,0 +1,208 @@
+"""Run several search configurations on one problem in parallel.
+
+Each configuration of a portfolio runs in its own process on the same
+`AirCargoProblem` and reports its plan and statistics through a queue. In
+'first' mode the first plan wins and the other processes are terminated; in
+'best' mode the runner waits for a cheaper plan until an optimal
+configuration (breadth-first or uniform-cost search, or A* with an
+admissible heuristic) has finished, every configuration has finished, or the
+time limit has passed.
+
+Example
+-------
+    python portfolio.py --problem 3 --mode first
+"""
+import argparse
+import multiprocessing
+import time
+from collections import OrderedDict
+from queue import Empty
+
+from aimacode.search import InstrumentedProblem, breadth_first_search
+from planning_search import best_first_search
+
+# Seconds between checks for workers that died without reporting
+POLL_INTERVAL = 0.1
+
+# name -> (algorithm, heuristic method or None, whether its plans are optimal)
+CONFIGS = OrderedDict([
+    ('breadth_first', ('breadth_first', None, True)),
+    ('uniform_cost', ('best_first', None, True)),
+    ('greedy_h_ignore_preconditions', ('greedy', 'h_ignore_preconditions', False)),
+    ('astar_h_1', ('best_first', 'h_1', True)),
+    ('astar_h_ignore_preconditions', ('best_first', 'h_ignore_preconditions', True)),
+    ('astar_h_pg_levelsum', ('best_first', 'h_pg_levelsum', False)),
+])
+
+
+class PortfolioResult():
+    """Outcome of `run_portfolio`.
+
+    Instance variables:
+        winner: str (name of the configuration whose plan was returned, or
+            None if no plan was found)
+        plan: list of Action (actions of the problem passed in)
+        cost: path cost of the plan
+        reports: OrderedDict name -> dict (status and statistics of every
+            configuration that reported before the portfolio stopped; status
+            'crashed' with the exit code for a worker that died silently)
+        cancelled: list of str (configurations without a report)
+        time: float (wall time in seconds)
+    """
+
+    def __init__(self):
+        self.winner = None
+        self.plan = None
+        self.cost = None
+        self.reports = OrderedDict()
+        self.cancelled = []
+        self.time = 0.
+
+
+def run_config(problem, config: str) -> dict:
+    """Solve `problem` with configuration `config` of `CONFIGS`.
+
+    :return: dict with 'status', 'plan' (list of str or None), 'cost',
+        'expansions', 'goal_tests', 'new_nodes' and 'time'
+    """
+    algorithm, heuristic, _ = CONFIGS[config]
+    h = None if heuristic is None else getattr(problem, heuristic)
+    start = time.time()
+    if algorithm == 'breadth_first':
+        instrumented = InstrumentedProblem(problem)
+        node = breadth_first_search(instrumented)
+        actions = None if node is None else node.solution()
+        return {'status': 'exhausted' if node is None else 'solved',
+                'plan': None if actions is None else [str(a) for a in actions],
+                'cost': None if node is None else node.path_cost,
+                'expansions': instrumented.succs, 'goal_tests': instrumented.goal_tests,
+                'new_nodes': instrumented.states, 'time': time.time() - start}
+    result = best_first_search(problem, h, greedy=algorithm == 'greedy')
+    report = dict(result.as_dict())
+    report['plan'] = None if result.plan is None else [str(a) for a in result.plan]
+    return report
+
+
+def _drain(queue, reports):
+    """Move the reports waiting in `queue` into the dict `reports`."""
+    while True:
+        try:
+            config, report = queue.get_nowait()
+        except Empty:
+            return
+        reports[config] = report
+
+
+def _worker(problem, config, queue):
+    try:
+        report = run_config(problem, config)
+    except Exception as e:
+        report = {'status': 'error', 'plan': None, 'cost': None, 'error': repr(e)}
+    queue.put((config, report))
+
+
+def run_portfolio(problem, configs=None, mode='first', time_limit=None) -> PortfolioResult:
+    """Race `configs` (names of `CONFIGS`, default all) on `problem`.
+
+    :param problem: AirCargoProblem (sent to every process, so it must be
+        picklable when processes are spawned rather than forked)
+    :param mode: str ('first': return the first plan found; 'best': return
+        the cheapest plan, stopping early once an optimal configuration
+        finishes)
+    :param time_limit: float (seconds; configurations still running then are
+        cancelled)
+    :return: PortfolioResult
+    """
+    if mode not in ('first', 'best'):
+        raise ValueError("Unknown portfolio mode {!r}".format(mode))
+    configs = list(configs or CONFIGS)
+    result = PortfolioResult()
+    start = time.time()
+    queue = multiprocessing.Queue()
+    processes = OrderedDict()
+    for config in configs:
+        process = multiprocessing.Process(target=_worker, args=(problem, config, queue), daemon=True)
+        process.start()
+        processes[config] = process
+
+    actions = dict((str(a), a) for a in problem.actions_list)
+    best = None
+    try:
+        while len(result.reports) < len(configs):
+            if time_limit is not None and time.time() - start >= time_limit:
+                break
+            try:
+                config, report = queue.get(timeout=POLL_INTERVAL)
+            except Empty:
+                # A worker killed before reporting (e.g. by the OOM killer)
+                # would otherwise be waited for forever
+                for config, process in processes.items():
+                    if config not in result.reports and process.exitcode is not None:
+                        _drain(queue, result.reports)
+                        if config not in result.reports:
+                            result.reports[config] = {'status': 'crashed', 'plan': None, 'cost': None,
+                                                      'exitcode': process.exitcode}
+                continue
+            result.reports[config] = report
+            if report['plan'] is not None and (best is None or report['cost'] < best[1]['cost']):
+                best = (config, report)
+            if mode == 'first' and best is not None:
+                break
+            # A finished optimal configuration bounds every other plan's cost
+            if mode == 'best' and CONFIGS[config][2] and report['status'] in ('solved', 'exhausted'):
+                break
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        # Keep the reports of configurations that finished meanwhile; the
+        # others were cancelled, whether they were still running or not
+        _drain(queue, result.reports)
+        result.cancelled = [config for config in configs if config not in result.reports]
+        queue.close()
+
+    if best is not None:
+        result.winner = best[0]
+        result.plan = [actions[name] for name in best[1]['plan']]
+        result.cost = best[1]['cost']
+    result.time = time.time() - start
+    return result
+
+
+def main():
+    from my_air_cargo_problems import air_cargo_generated, air_cargo_p1, air_cargo_p2, air_cargo_p3
+
+    problems = {1: air_cargo_p1, 2: air_cargo_p2, 3: air_cargo_p3}
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--problem', type=int, choices=sorted(problems), default=1)
+    parser.add_argument('--size', default=None,
+                        help="CxPxA: solve a generated problem instead of --problem")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--configs', nargs='+', default=None)
+    parser.add_argument('--mode', choices=['first', 'best'], default='first')
+    parser.add_argument('--time-limit', type=float, default=None)
+    args = parser.parse_args()
+
+    unknown = [c for c in args.configs or [] if c not in CONFIGS]
+    if unknown:
+        parser.error("unknown configurations {} (choose from {})".format(unknown, list(CONFIGS)))
+    if args.size is not None:
+        from cargo_benchmark import parse_size
+        problem = air_cargo_generated(*parse_size(args.size), seed=args.seed)
+    else:
+        problem = problems[args.problem]()
+
+    result = run_portfolio(problem, args.configs, args.mode, args.time_limit)
+    for config, report in result.reports.items():
+        print("{:<30} {:<10} cost {} expansions {} time {:.3f}".format(
+            config, report['status'], report['cost'], report.get('expansions'), report.get('time', 0.)))
+    for config in result.cancelled:
+        print("{:<30} cancelled".format(config))
+    print("winner {} (cost {}) in {:.3f}s".format(result.winner, result.cost, result.time))
+    for action in result.plan or []:
+        print("  {}{}".format(action.name, action.args))
+
+
+if __name__ == "__main__":
+    main()
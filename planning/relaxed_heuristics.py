@@ -0,0 +1,147 @@
+"""Delete-relaxation heuristics over integer-indexed fluents and actions.
+
+In the delete relaxation actions never remove fluents, so the cost of
+reaching each fluent from a state can be computed by a single fixpoint: a
+Dijkstra-like sweep in which an action becomes available once all its
+preconditions have a final cost. Combining precondition costs with `max`
+gives the admissible h_max, with `sum` the more informative (inadmissible)
+h_add. h_FF extracts an actual relaxed plan from the best supporters of the
+goals and counts its actions; the applicable actions that achieve one of its
+subgoals are FF's helpful actions.
+
+States are the fluent bitmasks of `AirCargoProblem` (bit i set when
+`state_map[i]` is true), i.e. the positive literal ids of the problem's
+`bitset_graph.ProblemIndex`, from which the actions are read. Negative
+preconditions are ignored, as the relaxation of a problem whose actions only
+need positive ones.
+"""
+import heapq
+
+from bitset_graph import ProblemIndex, iter_bits
+
+INF = float('inf')
+
+
+class RelaxedIndex():
+    """Precondition and add-effect ids of every real action of a problem,
+    as lists, from the positive literals of its ProblemIndex masks.
+
+    :param index: ProblemIndex of the problem
+    """
+
+    def __init__(self, index: ProblemIndex):
+        real = range(index.num_real_actions)
+        self.actions = index.actions[:index.num_real_actions]
+        self.num_fluents = index.num_fluents
+        self.pre_mask = [index.pre[a] & index.pos_mask for a in real]
+        self.pre = [list(iter_bits(mask)) for mask in self.pre_mask]
+        self.add = [list(iter_bits(index.eff[a] & index.pos_mask)) for a in real]
+        # fluent id -> actions needing it
+        self.needed_by = [[] for _ in range(self.num_fluents)]
+        for a, pre in enumerate(self.pre):
+            for f in pre:
+                self.needed_by[f].append(a)
+        self.goals = sorted(set(index.goal))
+        self.goal_mask = 0
+        for g in self.goals:
+            self.goal_mask |= 1 << g
+
+    def costs(self, bits: int, additive: bool):
+        """Relaxed cost of every fluent from the state `bits` and the best
+        supporting action of every fluent not in the state.
+
+        :param additive: bool (sum precondition costs, as h_add; otherwise
+            take their max, as h_max)
+        :return: (list of float, list of int or None)
+        """
+        cost = [INF] * self.num_fluents
+        supporter = [None] * self.num_fluents
+        waiting = [len(pre) for pre in self.pre]
+        queue = []
+        for f in iter_bits(bits):
+            cost[f] = 0
+            queue.append((0, f))
+        # actions without preconditions are available from the start
+        for a, pre in enumerate(self.pre):
+            if not pre:
+                for f in self.add[a]:
+                    if 1 < cost[f]:
+                        cost[f] = 1
+                        supporter[f] = a
+                        queue.append((1, f))
+        heapq.heapify(queue)
+
+        done = 0
+        remaining = len(self.goals)
+        while queue:
+            c, f = heapq.heappop(queue)
+            if c > cost[f] or done >> f & 1:
+                continue
+            done |= 1 << f
+            if self.goal_mask >> f & 1:
+                remaining -= 1
+                # h_max/h_add only need the goal costs
+                if not remaining:
+                    break
+            for a in self.needed_by[f]:
+                waiting[a] -= 1
+                if waiting[a]:
+                    continue
+                pre_costs = [cost[p] for p in self.pre[a]]
+                action_cost = 1 + (sum(pre_costs) if additive else max(pre_costs))
+                for g in self.add[a]:
+                    if action_cost < cost[g]:
+                        cost[g] = action_cost
+                        supporter[g] = a
+                        heapq.heappush(queue, (action_cost, g))
+        return cost, supporter
+
+    def h_max(self, bits: int) -> float:
+        cost, _ = self.costs(bits, False)
+        return max([cost[g] for g in self.goals] or [0])
+
+    def h_add(self, bits: int) -> float:
+        cost, _ = self.costs(bits, True)
+        return sum(cost[g] for g in self.goals)
+
+    def relaxed_plan(self, bits: int):
+        """FF relaxed plan from the h_add best supporters.
+
+        :return: (set of action ids or None if a goal is unreachable,
+            mask of the plan's subgoals not true in `bits`)
+        """
+        cost, supporter = self.costs(bits, True)
+        plan = set()
+        subgoals = 0
+        stack = [g for g in self.goals if not bits >> g & 1]
+        while stack:
+            f = stack.pop()
+            if subgoals >> f & 1:
+                continue
+            subgoals |= 1 << f
+            a = supporter[f]
+            if a is None:
+                return None, subgoals
+            if a not in plan:
+                plan.add(a)
+                stack.extend(p for p in self.pre[a] if not bits >> p & 1)
+        return plan, subgoals
+
+    def h_ff(self, bits: int) -> float:
+        plan, _ = self.relaxed_plan(bits)
+        return INF if plan is None else len(plan)
+
+    def helpful_actions(self, bits: int) -> list:
+        """Ids of the actions applicable in `bits` (positive preconditions)
+        that add a subgoal of the relaxed plan, in `actions_list` order.
+        """
+        plan, subgoals = self.relaxed_plan(bits)
+        if plan is None:
+            return []
+        helpful = []
+        for a, pre_mask in enumerate(self.pre_mask):
+            if pre_mask & ~bits:
+                continue
+            if any(subgoals >> f & 1 for f in self.add[a]):
+                helpful.append(a)
+        return helpful